@@ -4,21 +4,178 @@ Pytest Config File
 Contains the fixtures used for individual tests.
 """
 import pytest
-from doc.summary import Summary
 import os
 import logging
 import json
-import re
 from motion_master_wrapper import MotionMasterWrapper
 import od as sod
 import cia402_state_control as sst
 import ea_psu_controller as ea
 import utilities as ut
 import time
+from types import SimpleNamespace
+from typing import List
 
 logger = logging.getLogger(__name__)
 currentdir = os.path.dirname(os.path.realpath(__file__))
-test_case_results = dict()
+# Maximum time for the EtherCAT nodes to show up after power on
+ETHERCAT_STARTUP_TIMEOUT_S = 10
+# Motion master takes up to 8 seconds to identify a single node after power cycle
+NODE_IDENTIFICATION_TIME_S = 8
+
+
+def _resolve_positions(actual_positions: List[int], requested: List[int]) -> List[int]:
+    """Map requested chain positions to indices in the device list.
+
+    Parameters
+    ----------
+    actual_positions : List[int]
+        Chain position of each device, in device list order.
+    requested : List[int]
+        Chain positions requested on the command line.
+
+    Returns
+    -------
+    List[int]
+        Device list indices of the requested positions. Positions not present in the chain are skipped.
+    """
+    position_to_index = {position: index for index, position in enumerate(actual_positions)}
+    return [position_to_index[position] for position in requested if position in position_to_index]
+
+
+def _parse_spec(spec: str, n_devices: int) -> List[int]:
+    """Parse a --inc/--exc position spec into a list of chain positions.
+
+    Parameters
+    ----------
+    spec : str
+        Either a single position (``2``), a comma separated list (``1,2,4``) or an inclusive range (``1-3``).
+    n_devices : int
+        Number of devices connected in the chain.
+
+    Returns
+    -------
+    List[int]
+        Sorted chain positions.
+    """
+    if ',' in spec:
+        positions = [int(position) for position in spec.split(',')]
+    elif '-' in spec:
+        first, last = spec.split('-')
+        positions = list(range(int(first), int(last) + 1))
+    else:
+        positions = [int(spec)]
+
+    assert max(positions) <= n_devices - 1, "The desired position is out of range for the " \
+                                            "connected devices. Please specify a position within " \
+                                            "the range 0 - {}" .format(n_devices - 1)
+    return sorted(set(positions))
+
+
+def _select(device_list: list, positions: List[int], exclude: bool = False) -> list:
+    """Select the devices at the given chain positions.
+
+    Parameters
+    ----------
+    device_list : list
+        Devices as provided by the Motion Master, not necessarily in chain order.
+    positions : List[int]
+        Chain positions to select.
+    exclude : bool
+        If True, return all devices except the ones at the given positions.
+
+    Returns
+    -------
+    list
+        The selected devices.
+    """
+    indices = _resolve_positions([device['info'].position for device in device_list], positions)
+    if exclude:
+        excluded = set(indices)
+        return [device for index, device in enumerate(device_list) if index not in excluded]
+    return [device_list[index] for index in indices]
+
+
+def _get_hardware_description(mmw: MotionMasterWrapper, device_address: int) -> dict:
+    """Retrieve the .hardware_description file of a device.
+
+    Parameters
+    ----------
+    mmw : MotionMasterWrapper
+        Connected Motion Master wrapper.
+    device_address : int
+        The address of the device as provided by Motion Master.
+
+    Returns
+    -------
+    dict
+        The parsed hardware description, or an empty dict if it could not be retrieved.
+    """
+    try:
+        return json.loads(mmw.get_device_file(device_address, '.hardware_description'))
+    except Exception as e:
+        logger.warning("Error retrieving .hardware_description: {}".format(e))
+        # If this fails, just ignore it and make the data empty.
+        return {}
+
+
+def _wait_for_ethercat_nodes(timeout: float, poll_interval: float = 0.2, stable_polls: int = 3) -> int:
+    """Wait until the number of nodes seen by the EtherCAT master stops changing.
+
+    Parameters
+    ----------
+    timeout : float
+        Maximum time to wait in seconds.
+    poll_interval : float
+        Time between two polls in seconds.
+    stable_polls : int
+        Number of consecutive polls that must see the same, non-zero, number of nodes.
+
+    Returns
+    -------
+    int
+        The last number of nodes seen.
+    """
+    deadline = time.monotonic() + timeout
+    last_count = -1
+    stable = 0
+    while time.monotonic() < deadline:
+        count = ut.number_of_nodes()
+        if count == last_count and count > 0:
+            stable += 1
+            if stable >= stable_polls:
+                break
+        else:
+            stable = 0
+        last_count = count
+        time.sleep(poll_interval)
+    return last_count
+
+
+def _wait_for_motion_master_nodes(mmw: MotionMasterWrapper, number_of_nodes: int, poll_interval: float = 0.2):
+    """Wait until the Motion Master has identified the given number of nodes.
+
+    The wait is bounded by the time the Motion Master needs in the worst case, see NODE_IDENTIFICATION_TIME_S.
+
+    Parameters
+    ----------
+    mmw : MotionMasterWrapper
+        Connected Motion Master wrapper.
+    number_of_nodes : int
+        Number of nodes on the EtherCAT network.
+    poll_interval : float
+        Time between two polls in seconds.
+    """
+    deadline = time.monotonic() + number_of_nodes * NODE_IDENTIFICATION_TIME_S
+    while time.monotonic() < deadline:
+        try:
+            if len(mmw.get_device_info()) >= number_of_nodes:
+                return
+        except Exception as e:
+            # Motion Master may not answer while it's busy identifying the nodes
+            logger.debug("Motion Master not ready yet: {}".format(e))
+        time.sleep(poll_interval)
+    logger.warning("Motion Master did not identify all %s nodes in time", number_of_nodes)
 
 
 def pytest_addoption(parser):
@@ -36,44 +193,60 @@ def pytest_addoption(parser):
                      help="Remote control Power Supply")
 
 
+def pytest_configure(config):
+    # Results of each test case, filled in by pytest_runtest_makereport
+    config.test_case_results = dict()
+
+
+@pytest.fixture(scope="session")
+def _opts(request):
+    """Command line options, looked up once per session."""
+    return SimpleNamespace(address=request.config.getoption("--address"),
+                           inc=request.config.getoption("--inc"),
+                           exc=request.config.getoption("--exc"),
+                           generate_doc=request.config.getoption("--generate_doc"),
+                           flash_fw=request.config.getoption("--flash_fw"),
+                           control_psu=request.config.getoption("--control_psu"))
+
+
 @pytest.fixture(scope="session", autouse=True)
-def psu(request):
+def psu(_opts):
     """Start the Power supply at beginning and stop at end of test execution.
     Exit if psu control is not requested.
     """
 
-    if request.config.getoption("--control_psu"):
+    if _opts.control_psu:
         logger.info("Turning ON power supply")
         _psu48 = ea.PsuEA(comport='ea-ps-48v')
         _psu48.remote_on()
         _psu48.output_on()
         # Wait till ethercat shows up
-        time.sleep(3)
-        # Wait for Motion Master's node identification
-        # Motion master takes 8 seconds to identify single node after power cycle
-        time.sleep(ut.number_of_nodes() * 8)
+        _wait_for_ethercat_nodes(ETHERCAT_STARTUP_TIMEOUT_S)
 
     yield
 
-    if request.config.getoption("--control_psu"):
+    if _opts.control_psu:
         logger.info("Turning OFF power supply")
         _psu48.output_off()
         _psu48.remote_off()
 
 
 @pytest.fixture(scope="session")
-def skip_flash_firmware(request):
-    if not request.config.getoption("--flash_fw"):
+def skip_flash_firmware(_opts):
+    if not _opts.flash_fw:
         pytest.skip("Skip flashing firmware")
 
 
 @pytest.fixture(scope='session')
-def mmw(request):
+def mmw(_opts):
     """Provide a Motion Master Wrapper"""
     # Attempt to connect to the Motion Master and initialize everything.
-    mmw = MotionMasterWrapper(request.config.getoption("--address"), 1.0)
+    mmw = MotionMasterWrapper(_opts.address, 1.0)
     try:
         mmw.connect_to_motion_master()
+        if _opts.control_psu:
+            # The nodes were just powered on, wait for Motion Master's node identification
+            _wait_for_motion_master_nodes(mmw, ut.number_of_nodes())
         # Gather device and parameter info for address and type checking.
         mmw.initialize_device_parameter_info_dict()
     except Exception as e:
@@ -86,7 +259,7 @@ def mmw(request):
 
 
 @pytest.fixture(scope='session')
-def device_list(request, mmw):
+def device_list(_opts, mmw):
     """Provide the complete list of devices or the specific device if mentioned in command line
      at the start of the session.
      Device list is initially created from parsing data from mmw. However, this created device list
@@ -95,211 +268,15 @@ def device_list(request, mmw):
      order of devices in device list.
      """
 
-    if request.config.getoption("--inc") is not None:
-        _device_list = list(mmw.device_and_parameter_info_dict.values())
-        _device_list_actual_position_index = []
-
-        for device in _device_list:
-            _device_list_actual_position_index.append(device['info'].position)
-
-        assert _device_list, "Device list is empty"
-        match1 = re.search(r'(,)', request.config.getoption("--inc"))
-        match2 = re.search(r'(-)', request.config.getoption("--inc"))
-
-        # For --inc 1,2,4
-        if match1 is not None:
-            number_of_nodes = re.split(r'\,', request.config.getoption("--inc"))
-            number_of_nodes = list(map(int, number_of_nodes))
-
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            index_list = []
-            for index_1, item_1 in enumerate(number_of_nodes):
-                for index_2, item_2 in enumerate(_device_list_actual_position_index):
-                    if item_1 == item_2:
-                        index_list.append(index_2)
-
-            number_of_nodes = index_list
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            modified_device_list = []
-            for i in number_of_nodes:
-                modified_device_list.append(_device_list[i])
-            _device_list = modified_device_list
-
-        # For --inc 1-3
-        elif match2 is not None:
-            number_of_nodes = re.split(r'\-', request.config.getoption("--inc"))
-            number_of_nodes = list(map(int, number_of_nodes))
-
-            number_of_nodes_extended = []
-            last_node = number_of_nodes[1] + 1
-            while number_of_nodes[0] < last_node:
-                number_of_nodes_extended.append(number_of_nodes[0])
-                number_of_nodes[0] += 1
-            number_of_nodes = number_of_nodes_extended
-
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            index_list = []
-            for index_1, item_1 in enumerate(number_of_nodes):
-                for index_2, item_2 in enumerate(_device_list_actual_position_index):
-                    if item_1 == item_2:
-                        index_list.append(index_2)
-
-            number_of_nodes = index_list
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            modified_device_list = []
-            for i in number_of_nodes:
-                modified_device_list.append(_device_list[i])
-            _device_list = modified_device_list
-
-        # For --inc 1
-        else:
-            assert _device_list, "Device list is empty"
-            desired_position = request.config.getoption("--inc")
-            desired_position = int(desired_position)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            list_of_nodes = []
-            for node in _device_list:
-                node_position = node['info'].position
-                if node_position == desired_position:
-                    list_of_nodes.append(node)
-            _device_list = list_of_nodes
-
-    elif request.config.getoption("--exc") is not None:
-        _device_list = list(mmw.device_and_parameter_info_dict.values())
-        _device_list_actual_position_index = []
-        for device in _device_list:
-            _device_list_actual_position_index.append(device['info'].position)
-
-        assert _device_list, "Device list is empty"
-        match1 = re.search(r'(,)', request.config.getoption("--exc"))
-        match2 = re.search(r'(-)', request.config.getoption("--exc"))
-        # For --exc 1,2,4
-        if match1 is not None:
-            number_of_nodes = re.split(r'\,', request.config.getoption("--exc"))
-            number_of_nodes = list(map(int, number_of_nodes))
-
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            index_list = []
-            for index_1, item_1 in enumerate(number_of_nodes):
-                for index_2, item_2 in enumerate(_device_list_actual_position_index):
-                    if item_1 == item_2:
-                        index_list.append(index_2)
-
-            number_of_nodes = index_list
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            excluded_device_list = []
-            for i in number_of_nodes:
-                excluded_device_list.append(_device_list[i])
-
-            total_number_of_nodes = []
-            for i in range(len(_device_list)):
-                total_number_of_nodes.append(i)
-            number_of_nodes = list(set(total_number_of_nodes).difference(number_of_nodes))
-
-            included_device_list = []
-            for i in number_of_nodes:
-                included_device_list.append(_device_list[i])
-            _device_list = included_device_list
-
-        # For --exc 1-3
-        elif match2 is not None:
-            number_of_nodes = re.split(r'\-', request.config.getoption("--exc"))
-            number_of_nodes = list(map(int, number_of_nodes))
-            number_of_nodes_extended = []
-            last_node = number_of_nodes[1] + 1
-            while number_of_nodes[0] < last_node:
-                number_of_nodes_extended.append(number_of_nodes[0])
-                number_of_nodes[0] += 1
-            number_of_nodes = number_of_nodes_extended
-
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            index_list = []
-            for index_1, item_1 in enumerate(number_of_nodes):
-                for index_2, item_2 in enumerate(_device_list_actual_position_index):
-                    if item_1 == item_2:
-                        index_list.append(index_2)
-
-            number_of_nodes = index_list
-            desired_position = max(number_of_nodes)
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            excluded_device_list = []
-            for i in number_of_nodes:
-                excluded_device_list.append(_device_list[i])
-
-            total_number_of_nodes = []
-            for i in range(len(_device_list)):
-                total_number_of_nodes.append(i)
-            number_of_nodes = list(set(total_number_of_nodes).difference(number_of_nodes))
-
-            included_device_list = []
-            for i in number_of_nodes:
-                included_device_list.append(_device_list[i])
-            _device_list = included_device_list
-
-        # For --exc 1
-        else:
-            assert _device_list, "Device list is empty"
-            desired_position = request.config.getoption("--exc")
-            desired_position = int(desired_position)
-            total_number_of_nodes = []
-            for i in range(len(_device_list)):
-                total_number_of_nodes.append(i)
-
-            assert desired_position <= len(_device_list) - 1, "The desired position is out of range for the " \
-                                                              "connected devices. Please specify a position within " \
-                                                              "the range 0 - {}" .format(len(_device_list) - 1)
-
-            desired_position = [desired_position]
-            index_list = []
-            for index_1, item_1 in enumerate(desired_position):
-                for index_2, item_2 in enumerate(_device_list_actual_position_index):
-                    if item_1 == item_2:
-                        index_list.append(index_2)
-
-            desired_position = index_list
-            number_of_nodes = list(set(total_number_of_nodes).difference(desired_position))
-
-            modified_device_list = []
-            for i in number_of_nodes:
-                modified_device_list.append(_device_list[i])
-            _device_list = modified_device_list
+    _device_list = list(mmw.device_and_parameter_info_dict.values())
+    assert _device_list, "Device list is empty"
 
-    else:
-        _device_list = list(mmw.device_and_parameter_info_dict.values())
+    if _opts.inc is not None:
+        # For --inc 1 / 1,2,4 / 1-3
+        _device_list = _select(_device_list, _parse_spec(_opts.inc, len(_device_list)))
+    elif _opts.exc is not None:
+        # For --exc 1 / 1,2,4 / 1-3
+        _device_list = _select(_device_list, _parse_spec(_opts.exc, len(_device_list)), exclude=True)
 
     assert _device_list, "Device list is empty"
 
@@ -308,26 +285,26 @@ def device_list(request, mmw):
         device['object_dictionary'] = sod.ObjectDictionary(mmw, device_address)
         device['state_control'] = sst.StateControl(mmw, device_address)
 
-        # Get the hardware description data from each node too.
-        try:
-            hardware_description_data = mmw.get_device_file(device_address, '.hardware_description')
-            hardware_description = json.loads(hardware_description_data)
-            device['hardware_description'] = hardware_description
-        except Exception as e:
-            logger.warning("Error retrieving .hardware_description: {}".format(e))
-            # If this fails, just ignore it and make the data empty.
-            device['hardware_description'] = {}
+        # Get the hardware description data from each node too. The requests go one after the other, the
+        # Motion Master connection is a single ZMQ socket that must not be used from several threads.
+        hardware_description = _get_hardware_description(mmw, device_address)
+        device['hardware_description'] = hardware_description
+        # Cache the device name, it's looked up by fixtures and tests
+        device['device_name'] = hardware_description.get('device', {}).get('name', '')
+        device['is_safety'] = 'Safety' in device['device_name']
 
     return _device_list
 
 
+@pytest.fixture(scope='session')
+def non_safety_devices(device_list):
+    """Provide the devices from the device list that are not Safety devices"""
+    return [device for device in device_list if not device['is_safety']]
+
+
 @pytest.fixture(scope="function", autouse=True)
-def clear_fault(device_list):
-    for device in device_list:
-        device_name = device['hardware_description']['device']['name']
-        match = re.search(r'(Safety)', device_name)
-        if match:
-            return
+def clear_fault(non_safety_devices):
+    for device in non_safety_devices:
         device['state_control'].fault_reset()
 
 
@@ -339,37 +316,52 @@ def skip_if_no_devices(device_list):
 
 
 @pytest.fixture(scope='session')
-def test_result_summary(request):
+def test_result_summary(request, _opts):
     """Creates summary file(.rst) of test results"""
-    global test_case_results
+    # Imported here so that runs without documentation don't load the summary and MySQL modules
+    from doc.summary import Summary
     _summary = Summary()
     yield _summary
 
     # Exit if documentation is not requested
-    if request.config.getoption("--generate_doc") is None:
+    if _opts.generate_doc is None:
         return
 
+    test_case_results = request.config.test_case_results
     for fname, res in test_case_results.items():
         _summary.save_test_results(fname, res)
-    _rst = _summary.serialize_test_record()
     _path = os.path.join(currentdir, "doc/atr/index.rst")
-    with open(_path, 'w') as f:
-        f.write(_rst)
-    test_case_results = dict()
+    # Write to a temporary file first, so that the previous index.rst is kept if the generation fails
+    _tmp_path = _path + '.tmp'
+    try:
+        with open(_tmp_path, 'w') as f:
+            _summary.serialize_test_record(out=f)
+    except BaseException:
+        os.remove(_tmp_path)
+        raise
+    os.replace(_tmp_path, _path)
+    test_case_results.clear()
 
 
-@pytest.fixture(scope="function", autouse=True)
+@pytest.fixture(scope="function")
 def collect_test_pydoc(request, test_result_summary):
-    """Collect test requirements from test scripts after every single test case."""
-    # Exit if documentation is not requested
-    if request.config.getoption("--generate_doc") is None:
-        return
-
+    """Collect test requirements from test scripts after every single test case.
+    Only used if documentation is requested, see pytest_collection_modifyitems.
+    """
     doc = request.function.__doc__
     fname = request.function.__name__
     test_result_summary.save_test_requirements(fname, doc)
 
 
+def pytest_collection_modifyitems(config, items):
+    """Attach collect_test_pydoc to every test case if documentation is requested."""
+    if config.getoption("--generate_doc") is None:
+        return
+
+    for item in items:
+        item.fixturenames.append("collect_test_pydoc")
+
+
 @pytest.hookimpl(tryfirst=True, hookwrapper=True)
 def pytest_runtest_makereport(item, call):
     """Get the result of each test case in test script
@@ -377,10 +369,9 @@ def pytest_runtest_makereport(item, call):
     Details on how this works can be found here:
         https://doc.pytest.org/en/latest/example/simple.html#making-test-result-information-available-in-fixtures
     """
-    global test_case_results
     outcome = yield
 
     result = outcome.get_result()
     if result.when == 'call':
-        test_case_results[item.name] = result
+        item.config.test_case_results[item.name] = result
         setattr(item, "rep_call", result)
@@ -2,12 +2,25 @@
 # coding=UTF-8
 """Generate ATP"""
 
+import os
 import pymysql
 
+# Every issue belongs to exactly one project, so the rows are already distinct
+REDMINE_QUERY = """
+    SELECT `i`.`id` AS `ID`
+        , `p`.`name` AS `Project Name`
+        , `i`.`subject` AS `Subject`
+    FROM `redmine`.`issues` AS `i`
+        INNER JOIN `projects` AS `p` ON `i`.`project_id` = `p`.`id`
+    WHERE `p`.`name` = 'SOMANET'
+    """
+
 
 class Mysql():
     """Describe Mysql connection
 
+    Can be used as a context manager, which connects on entry and closes the connection on exit.
+
     :param host: A string defining the Mysql database host
     :param port: A string defining the Mysql database port
     :param user: A string defining the Mysql database user
@@ -23,30 +36,48 @@ class Mysql():
         self.database = database
         self.connection = None
 
+    @classmethod
+    def from_env(cls):
+        """Create the connection description from environment variables.
+
+        REDMINE_DB_PASSWORD is mandatory, REDMINE_DB_HOST, REDMINE_DB_PORT, REDMINE_DB_USER
+        and REDMINE_DB_NAME fall back to the CI Redmine database.
+
+        :return: Mysql instance, not yet connected"""
+        try:
+            password = os.environ['REDMINE_DB_PASSWORD']
+        except KeyError:
+            raise RuntimeError('REDMINE_DB_PASSWORD is not set') from None
+        return cls(host=os.environ.get('REDMINE_DB_HOST', '3.214.208.25'),
+                   port=int(os.environ.get('REDMINE_DB_PORT', 3333)),
+                   user=os.environ.get('REDMINE_DB_USER', 'root'),
+                   password=password,
+                   database=os.environ.get('REDMINE_DB_NAME', 'redmine'))
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def connect(self):
         """Connect to the database"""
-        try:
-            self.connection = pymysql.connect(host=self.host, port=self.port,
-                                              user=self.user, passwd=self.password, database=self.database)
-        except pymysql.ProgrammingError as e:
-            print(e)
+        # Unbuffered cursor, rows are streamed from the server instead of being buffered twice
+        self.connection = pymysql.connect(host=self.host, port=self.port,
+                                          user=self.user, passwd=self.password, database=self.database,
+                                          cursorclass=pymysql.cursors.SSCursor, autocommit=True)
+
+    def close(self):
+        """Close the connection to the database"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
 
     def get_redmine_data(self):
         """Queries requirements from Redmine and stores results
 
         :return: list of tuples with requirements ID, project name and subject"""
         with self.connection.cursor() as cur:
-            try:
-                query = """
-                    SELECT DISTINCT `i`.`id` AS `ID`
-                        , `p`.`name` AS `Project Name`
-                        , `i`.`subject` AS `Subject`
-                    FROM `redmine`.`issues` AS `i`
-                        INNER JOIN `issue_statuses` AS `is` ON `i`.`status_id` = `is`.`id`
-                        INNER JOIN `projects` AS `p` ON `i`.`project_id` = `p`.`id`
-                    WHERE `p`.`name` LIKE 'SOMANET'
-                    """
-                cur.execute(query)
-                return cur.fetchall()
-            except pymysql.InternalError as e:
-                print(e)
+            cur.execute(REDMINE_QUERY)
+            return list(cur)
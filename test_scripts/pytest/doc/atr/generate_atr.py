@@ -2,10 +2,19 @@
 # coding=UTF-8
 """Generate ATR"""
 
+import glob
+import hashlib
+import os
 import subprocess
-import fileinput
 import sys
 
+CONF_FILE = 'conf.py'
+SPHINXOPTS = '-j auto -q'
+BUILD_DIR = '_build'
+PDF_FILE = os.path.join(BUILD_DIR, 'latex', 'SOMANETTestDoc.pdf')
+# Hash of the inputs the PDF was last generated from
+HASH_FILE = os.path.join(BUILD_DIR, '.atr_hash')
+
 
 class ATR():
     """Use to generate pdf summary"""
@@ -14,16 +23,42 @@ class ATR():
         # Format test name
         self.test_name = test_name.replace('_',' ').capitalize()
 
+    @staticmethod
+    def replace_in_conf(old, new):
+        """Replace a string in the sphinx configuration, reading and writing the file once"""
+        with open(CONF_FILE) as f:
+            content = f.read()
+        new_content = content.replace(old, new)
+        # Don't touch the file if nothing changes, sphinx would consider it modified
+        if new_content != content:
+            with open(CONF_FILE, 'w') as f:
+                f.write(new_content)
+
     def edit_test_name_conf(self):
         """Edit the test name in sphinx configuration"""
+        self.replace_in_conf('{Test}', '{' + self.test_name + '}')
 
-        for line in fileinput.input('conf.py', inplace=True):
-            # inside this loop the STDOUT will be redirected to the file
-            print(line.replace('{Test}', '{' + self.test_name + '}'), end='')
+    @staticmethod
+    def inputs_hash():
+        """Return the SHA-256 of the sphinx configuration and the rst sources"""
+        sha = hashlib.sha256()
+        for filename in sorted([CONF_FILE] + glob.glob('*.rst')):
+            sha.update(filename.encode('utf-8'))
+            with open(filename, 'rb') as f:
+                sha.update(f.read())
+        return sha.hexdigest()
 
     def generate_pdf(self):
-        """Generate pdf report"""
-        proc = subprocess.run(['make', 'latexpdf'],
+        """Generate pdf report, unless it was already generated from the same inputs"""
+        inputs_hash = self.inputs_hash()
+        if os.path.isfile(PDF_FILE) and os.path.isfile(HASH_FILE):
+            with open(HASH_FILE) as f:
+                if f.read() == inputs_hash:
+                    print('{} is up to date'.format(PDF_FILE))
+                    return
+
+        # Let sphinx use all cores and only report warnings and errors
+        proc = subprocess.run(['make', 'latexpdf', 'SPHINXOPTS=' + SPHINXOPTS],
                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                               check=True)
         if proc.returncode != 0:
@@ -32,11 +67,12 @@ class ATR():
         else:
             print(proc.stdout.decode('utf-8').rstrip('\n'))
 
+        with open(HASH_FILE, 'w') as f:
+            f.write(inputs_hash)
+
     def revert_edit(self):
         """Edit the name back"""
-        for line in fileinput.input('conf.py', inplace=True):
-            # inside this loop the STDOUT will be redirected to the file
-            print(line.replace('{' + self.test_name + '}', '{Test}'), end='')
+        self.replace_in_conf('{' + self.test_name + '}', '{Test}')
 
 
 if __name__ == '__main__':
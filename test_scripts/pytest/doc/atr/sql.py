@@ -2,12 +2,15 @@
 # coding=UTF-8
 """Generate ATP"""
 
+import os
 import pymysql
 
 
 class Mysql():
     """Describe Mysql connection
 
+    The connection is kept open once established, so it can be reused by several queries.
+
     :param host: A string defining the Mysql database host
     :param port: A string defining the Mysql database port
     :param user: A string defining the Mysql database user
@@ -23,18 +26,49 @@ class Mysql():
         self.database = database
         self.connection = None
 
+    @classmethod
+    def from_env(cls):
+        """Create the connection description from environment variables.
+
+        REDMINE_DB_PASSWORD is mandatory, REDMINE_DB_HOST, REDMINE_DB_PORT, REDMINE_DB_USER
+        and REDMINE_DB_NAME fall back to the CI Redmine database.
+
+        :return: Mysql instance, not yet connected"""
+        try:
+            password = os.environ['REDMINE_DB_PASSWORD']
+        except KeyError:
+            raise RuntimeError('REDMINE_DB_PASSWORD is not set') from None
+        return cls(host=os.environ.get('REDMINE_DB_HOST', '3.214.208.25'),
+                   port=int(os.environ.get('REDMINE_DB_PORT', 3333)),
+                   user=os.environ.get('REDMINE_DB_USER', 'root'),
+                   password=password,
+                   database=os.environ.get('REDMINE_DB_NAME', 'redmine'))
+
     def connect(self):
-        """Connect to the database"""
+        """Connect to the database, reusing the open connection if there is one"""
+        if self.connection is not None:
+            # Transparently reopens the connection if the server dropped it
+            self.connection.ping(reconnect=True)
+            return
         try:
             self.connection = pymysql.connect(host=self.host, port=self.port,
                                               user=self.user, passwd=self.password, database=self.database)
         except pymysql.ProgrammingError as e:
             print(e)
 
-    def get_redmine_data(self):
+    def close(self):
+        """Close the connection to the database"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get_redmine_data(self, ids=None):
         """Queries requirements from Redmine and stores results
 
+        :param ids: optional collection of requirement IDs, only these requirements are fetched
         :return: list of tuples with requirements ID, project name and subject"""
+        if ids is not None and not ids:
+            return ()
         with self.connection.cursor() as cur:
             try:
                 query = """
@@ -46,7 +80,12 @@ class Mysql():
                         INNER JOIN `projects` AS `p` ON `i`.`project_id` = `p`.`id`
                     WHERE `p`.`name` LIKE 'SOMANET'
                     """
-                cur.execute(query)
+                args = None
+                if ids is not None:
+                    # Fetch all requested requirements in a single query
+                    args = tuple(ids)
+                    query += "AND `i`.`id` IN ({})".format(', '.join(['%s'] * len(args)))
+                cur.execute(query, args)
                 return cur.fetchall()
             except pymysql.InternalError as e:
                 print(e)
@@ -1,5 +1,6 @@
 """Module for outputting test record to RST formatted files."""
 
+import io
 import os
 import re
 from doc.atr.sql import Mysql
@@ -12,6 +13,10 @@ currentdir = os.path.dirname(os.path.realpath(__file__))
 parentdir = os.path.dirname(currentdir)
 
 logger = logging.getLogger(__name__)
+# Matches the requirement IDs following the :requirements: tag
+_REQ_RE = re.compile(r'(?<=:requirements: )\s*([\d,\s]*)')
+# Matches the base name of a parametrized test case
+_PARAM_RE = re.compile(r'(test_.+)\[')
 
 class AutoName(Enum):
     """This class simply returns text from enum. Taken from the enum
@@ -34,14 +39,27 @@ class TableColumns(Enum):
     RESULT = 3
 
 
+def _merge_status(status, passed):
+    """Merge the outcome of one more test into the status of a requirement
+
+    :param status: current RequirementStatus value of the requirement
+    :param passed: whether the test passed
+
+    :return: new RequirementStatus value, PARTIAL as soon as passed and failed tests are mixed
+    """
+    if status == RequirementStatus.PASS.value and not passed \
+            or status == RequirementStatus.FAIL.value and passed:
+        return RequirementStatus.PARTIAL.value
+    return status
+
+
 class ATR():
 
     def get_test_requirements(self, doc):
         # Match in the doc the requirement string
 
         # Check if requirements IDs are mentioned or not
-        match = re.search(
-            r'(?<=:requirements: )\s*([\d,\s]*)', doc)
+        match = _REQ_RE.search(doc)
         matched_req = match.group(1).split(',')
         return matched_req
 
@@ -49,21 +67,27 @@ class ATR():
 class Summary():
     """This class contains everything related to the ATR summary generation"""
 
+    # Redmine database connection, shared by all summaries of the session
+    _sql = None
+
     def __init__(self, test_file_path=None, **kwargs):
         self.test_cases = defaultdict(dict)
         self.redmine_data = None
+        # Redmine rows indexed by requirement ID
+        self.redmine_data_by_id = {}
         self.test_file_path = test_file_path
         self.atr = ATR()
 
-    def init_mysql(self):
-        """Initialize redmine data from mysql server."""
-        sql = Mysql(host='3.214.208.25',
-                    port=3333,
-                    user='root',
-                    password='yshtGT7kzcXGHD6Bk4qPTvV92PLsZHNG',
-                    database='redmine')
-        sql.connect()
-        self.redmine_data = sql.get_redmine_data()
+    def init_mysql(self, ids=None):
+        """Initialize redmine data from mysql server.
+
+        :param ids: optional collection of requirement IDs to fetch, all requirements are fetched otherwise
+        """
+        if Summary._sql is None:
+            Summary._sql = Mysql.from_env()
+        Summary._sql.connect()
+        self.redmine_data = Summary._sql.get_redmine_data(ids)
+        self.redmine_data_by_id = {item[0]: item for item in self.redmine_data}
 
     def save_test_requirements(self, fname, doc):
         requirements = self.atr.get_test_requirements(doc)
@@ -71,101 +95,96 @@ class Summary():
             logger.warning("Requirements are missing in %s", fname)
             sys.exit()
         else:
-            self.test_cases[fname]['req'] = requirements
-            logger.debug(self.test_cases)
+            self.test_cases[fname]['req'] = [int(req) for req in requirements]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%r', self.test_cases)
 
     def save_test_results(self, fname, results):
         # modify the name of paramaterised test case if any
         # to match it with fname in save_test_requirements()
-        res = re.match(r'(test_.+)\[', fname)
+        res = _PARAM_RE.match(fname)
         if res:
             fname = res.group(1)
         self.test_cases[fname]['res'] = results
-        logger.debug(self.test_cases)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%r', self.test_cases)
+
+    def serialize_test_record(self, out=None):
+        """Aggregate the test results per requirement and generate the ATR rst
 
-    def serialize_test_record(self):
-        dict_test_record = self.test_cases
-        # connect to database
-        self.init_mysql()
+        :param out: optional file-like object the rst is written to
+
+        :return: string containing the rst, or None if it was written to out
+        """
+        # connect to database and fetch only the requirements referenced by the tests
+        self.init_mysql({req for req_res in self.test_cases.values() for req in req_res['req']})
 
-        d = defaultdict(list)
+        d = {}
 
-        for test_name, req_res in dict_test_record.items():
+        for req_res in self.test_cases.values():
+            passed = req_res['res'].outcome == "passed"
             for req in req_res['req']:
-                # Adding a requirement not already present:
-                req = int(req)
-                if not d[req]:
-                    d_req = defaultdict(list)
-
-                    # Find requirement tuple in redmine data:
-                    redmine_data_req = [
-                        item for item in self.redmine_data if item[0] == req][0]
-                    d_req['id'] = redmine_data_req[0]
-                    d_req['name'] = redmine_data_req[2]
-                    d_req['test_count'] = 1
-                    if req_res['res'].outcome == "passed":
-                        d_req['status'] = RequirementStatus.PASS.value
-
-                    elif req_res['res'].outcome != "passed":
-                        d_req['status'] = RequirementStatus.FAIL.value
-                    d[req] = d_req
+                if req not in d:
+                    # Adding a requirement not already present, find its tuple in redmine data:
+                    redmine_data_req = self.redmine_data_by_id[req]
+                    d[req] = {
+                        'id': redmine_data_req[0],
+                        'name': redmine_data_req[2],
+                        'test_count': 1,
+                        'status': RequirementStatus.PASS.value if passed else RequirementStatus.FAIL.value,
+                    }
                 else:
                     d[req]['test_count'] += 1
-                    if req_res['res'].outcome != "passed" and d[req]['status'] == RequirementStatus.PASS.value \
-                            or d[req]['status'] == RequirementStatus.FAIL.value and req_res['res'].outcome == "passed":
-                        d[req]['status'] = RequirementStatus.PARTIAL.value
+                    d[req]['status'] = _merge_status(d[req]['status'], passed)
 
-        return self.generate_rst(OrderedDict(sorted(d.items())))
+        return self.generate_rst(OrderedDict(sorted(d.items())), out)
 
-    def generate_rst_table(self, rows, max_width_cols, columns_headers, leading_spaces=0):
+    def generate_rst_table(self, rows, max_width_cols, columns_headers, leading_spaces=0, out=None):
         """Generate rst table from tests results
 
         :param rows: list of dictionaries containing id, description, status and number of tests of a requirement
         :param max_width_cols: list of maximum width of all columns
         :param columns_headers: list of columns titles
         :param leading_spaces: number of leading space before each line of the table
+        :param out: optional file-like object the table is written to, line by line
 
-        :return: rst table with test results
+        :return: rst table with test results, or None if it was written to out
         """
+        if out is None:
+            out = io.StringIO()
+            self.generate_rst_table(rows, max_width_cols, columns_headers, leading_spaces, out)
+            return out.getvalue()
 
-        # Line 1
-        header_1 = ''
-        header_2 = ''
-        for max_width in max_width_cols:
-            header_1 += '+-' + '-' * max_width + '-'
-        header_1 += '+'
+        indent = ' ' * leading_spaces
 
-        # Line 2
-        for index, max_width in enumerate(max_width_cols):
-            header_2 += '| ' + columns_headers[index] + ' ' * (max_width -
-                                                               len(columns_headers[index])) + ' '
-        header_2 += '|'
+        # Line 1, also used as separator between rows
+        header_1 = '+' + '+'.join('-' * (max_width + 2) for max_width in max_width_cols) + '+'
 
-        header_3 = header_1
+        # Every other line, each cell is left aligned and padded to the column width
+        row_template = indent + ''.join(f"| {{:<{max_width}}} " for max_width in max_width_cols) + '|'
 
-        header = '\n'.join([' ' * leading_spaces + header_1,
-                            ' ' * leading_spaces + header_2,
-                            ' ' * leading_spaces + header_3])
+        # Line 2
+        header_2 = row_template.format(*columns_headers)
 
-        content = ''
+        header_3 = header_1
 
-        for row_index in range(len(rows)):
-            line = '\n' + ' ' * leading_spaces
-            for column_index in range(len(columns_headers)):
-                column_content = str(rows[row_index][column_index])
-                line += '| ' + column_content + ' ' * \
-                    (max_width_cols[column_index] - len(column_content)) + ' '
-            content += line + '|\n' + ' ' * leading_spaces + header_1
+        out.write(indent + header_1 + '\n' + header_2 + '\n' + indent + header_3 + '\n')
 
-        return header + content + '\n'
+        for row in rows:
+            out.write(row_template.format(*row) + '\n' + indent + header_1 + '\n')
 
-    def generate_rst(self, d):
+    def generate_rst(self, d, out=None):
         """A table at the top of an ATR document describes how tests for each requirement ran
 
         :param d: dictionary representing data from requirement id. Keys are id, description, test_count and status
+        :param out: optional file-like object the rst is written to
 
-        :return: string containing the rst
+        :return: string containing the rst, or None if it was written to out
         """
+        if out is None:
+            out = io.StringIO()
+            self.generate_rst(d, out)
+            return out.getvalue()
 
         title = """..    include:: <isopub.txt>
 
@@ -204,27 +223,19 @@ Acceptance Test Results
         # column has its own width
         # The column width is equal to the longest
         # string on each column
-        rows = []
         columns_headers = ['**ID**', '**Requirement Description**',
                            '**Number of tests**', '**Result**']
-        max_width_cols = [len(x) for x in columns_headers]
-
+        rows = []
         for req_id, req_data in d.items():
             l_req = [None] * len(columns_headers)
             l_req[TableColumns.ID.value] = req_id
             l_req[TableColumns.DESCRIPTION.value] = req_data['name']
             l_req[TableColumns.RESULT.value] = req_data['status']
             l_req[TableColumns.TEST_COUNT.value] = req_data['test_count']
-
-            max_width_cols[TableColumns.ID.value] = max(
-                len(str(l_req[TableColumns.ID.value])), max_width_cols[TableColumns.ID.value])
-            max_width_cols[TableColumns.DESCRIPTION.value] = max(
-                len(str(l_req[TableColumns.DESCRIPTION.value])), max_width_cols[TableColumns.DESCRIPTION.value])
-            max_width_cols[TableColumns.RESULT.value] = max(
-                len(str(l_req[TableColumns.RESULT.value])), max_width_cols[TableColumns.RESULT.value])
-            max_width_cols[TableColumns.TEST_COUNT.value] = max(
-                len(str(l_req[TableColumns.TEST_COUNT.value])), max_width_cols[TableColumns.TEST_COUNT.value])
-
             rows.append(l_req)
 
-        return title + self.generate_rst_table(rows, max_width_cols, columns_headers)
+        # Each column starts with its header, so the width is also defined when there are no rows
+        max_width_cols = [max(len(str(value)) for value in column) for column in zip(columns_headers, *rows)]
+
+        out.write(title)
+        self.generate_rst_table(rows, max_width_cols, columns_headers, out=out)
@@ -326,40 +326,66 @@ class MotionMasterWrapper:
         OperationFailed
             When the set operation reports an error.
         """
+        self.set_device_parameter_values(device_address, [(index, subindex, value)])
 
-        msg, obs = self._get_request_and_single_response_observable(
-            "set 0x{:04x}:{} to {}".format(index, subindex, value))
+    def set_device_parameter_values(self, device_address: int, parameter_values: List[Tuple[int, int, Any]]):
+        """Set several device parameters in a single request. This method blocks until all writes are confirmed.
+
+        Please remember to initialize the wrapper with `initialize_device_parameter_info_dict()` before calling
+        this function.
+
+        Parameters
+        ----------
+        device_address : int
+            The unique identifier for the device you wish to use
+        parameter_values : List[Tuple[int, int, Any]]
+            The (index, subindex, value) of every object to write, in writing order. The types will be looked up
+            from the device parameter info stored locally.
+
+        Raises
+        ------
+        TypeError
+            When the type of a value can't be deduced.
+        OperationFailed
+            When a set operation reports an error.
+        """
+        msg, obs = self._get_request_and_single_response_observable(", ".join(
+            "set 0x{:04x}:{} to {}".format(index, subindex, value) for index, subindex, value in parameter_values))
         msg.request.set_device_parameter_values.device_address = device_address
-        parameter = msg.request.set_device_parameter_values.parameter_values.add()
-        parameter.index = index
-        parameter.subindex = subindex
 
         # Set the value based on the type.
         if len(self.device_and_parameter_info_dict) == 0:
-            raise TypeError("Unclear how to encode {} in the message; dictionary is not populated.".format(value))
-
-        param_info = self.device_and_parameter_info_dict.get(str(device_address)).get('parameters').get(
-            "{:04x}:{}".format(index, subindex))
-        if param_info is None:
-            raise KeyError("Object 0x{:04x}:{} doesn't exist for device {}.".format(index, subindex, device_address))
-        if 1 <= param_info.value_type <= 7:
-            # Value is some type of integer.
-            parameter.int_value = value
-        elif param_info.value_type == 8:
-            parameter.float_value = value
-        elif param_info.value_type == 9:
-            parameter.string_value = value
-        elif 10 <= param_info.value_type <= 11:
-            parameter.raw_value = value
-        elif param_info.value_type == 12:
-            parameter.int_value = value
-        else:
-            raise TypeError("Type for object 0x{:04x}:{} isn't understood.".format(index, subindex))
+            raise TypeError("Unclear how to encode {} in the message; dictionary is not populated.".format(
+                parameter_values))
+        parameters_info = self.device_and_parameter_info_dict.get(str(device_address)).get('parameters')
+
+        for index, subindex, value in parameter_values:
+            parameter = msg.request.set_device_parameter_values.parameter_values.add()
+            parameter.index = index
+            parameter.subindex = subindex
+
+            param_info = parameters_info.get("{:04x}:{}".format(index, subindex))
+            if param_info is None:
+                raise KeyError("Object 0x{:04x}:{} doesn't exist for device {}.".format(index, subindex,
+                                                                                      device_address))
+            if 1 <= param_info.value_type <= 7:
+                # Value is some type of integer.
+                parameter.int_value = value
+            elif param_info.value_type == 8:
+                parameter.float_value = value
+            elif param_info.value_type == 9:
+                parameter.string_value = value
+            elif 10 <= param_info.value_type <= 11:
+                parameter.raw_value = value
+            elif param_info.value_type == 12:
+                parameter.int_value = value
+            else:
+                raise TypeError("Type for object 0x{:04x}:{} isn't understood.".format(index, subindex))
 
         self.send_to_motion_master(msg)
         message = obs.run()
-        return_parameter = message.status.device_parameter_values.parameter_values[0]
-        _check_device_parameter_value_status(return_parameter)
+        for return_parameter in message.status.device_parameter_values.parameter_values:
+            _check_device_parameter_value_status(return_parameter)
 
     def get_motion_master_version(self) -> str:
         """Return the version string of the Motion Master
@@ -378,6 +404,23 @@ class MotionMasterWrapper:
         message = obs.run()
         return message.status.system_version.version
 
+    def get_device_info(self) -> List[Any]:
+        """Return the info of all devices the Motion Master has identified on the network
+
+        This method blocks with a timeout.
+
+        Returns
+        -------
+        devices : List[Any]
+            The device info messages, containing among others device_address and position.
+        """
+        msg, obs = self._get_request_and_single_response_observable("get device info")
+        msg.request.get_device_info.SetInParent()
+        self.send_to_motion_master(msg)
+        message = obs.run()
+        obs.dispose()
+        return list(message.status.device_info.devices)
+
     def initialize_device_parameter_info_dict(self):
         """Retrieve and set device_parameter_info_dict for all devices
 
@@ -390,13 +433,8 @@ class MotionMasterWrapper:
         """
         # Find all devices on the network
         logger.debug("Retrieving the list of devices found on the network...")
-        msg, obs = self._get_request_and_single_response_observable("get device info")
-        msg.request.get_device_info.SetInParent()
-        self.send_to_motion_master(msg)
-        message = obs.run()
-        obs.dispose()
         self.device_and_parameter_info_dict.clear()
-        for device_info in message.status.device_info.devices:
+        for device_info in self.get_device_info():
             # Store the device under the device_address as the primary key.
             # TODO: Rewrite these update() calls with a faster array notation.
             self.device_and_parameter_info_dict.update({str(device_info.device_address): {"info": device_info}})
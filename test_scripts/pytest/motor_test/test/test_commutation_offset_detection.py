@@ -4,8 +4,8 @@ Commutation Offset Detection test
 import time
 import logging
 import pytest
+import numpy as np
 import oscmd_helpers
-from random import choice
 from typing import Any, Dict
 from enum import Enum, unique
 import toolbox as stb
@@ -21,6 +21,33 @@ class OffsetDetectionState(Enum):
     OFFSET_VALID = 2
 
 
+OFFSET_VALID_STATE = OffsetDetectionState.OFFSET_VALID.value
+# Name of each state, by value
+OFFSET_DETECTION_STATE_NAMES = {state.value: state.name for state in OffsetDetectionState}
+
+
+def compute_offset_errors(angle_offsets, electrical_angle_resolution):
+    """Convert measured offsets to electrical degrees and compute their error to the average.
+
+    Parameters
+    ----------
+    angle_offsets : List[int]
+        Measured commutation angle offsets [Ticks]
+    electrical_angle_resolution : int
+        Resolution of one electrical revolution [Ticks]
+
+    Returns
+    -------
+    average_degree : float
+        Average of the offsets [Degree Electric]
+    error_degrees : np.ndarray
+        Error of each offset to the average [Degree Electric]
+    """
+    offset_degrees = np.asarray(angle_offsets) * (360 / electrical_angle_resolution)
+    average_degree = offset_degrees.mean()
+    return average_degree, offset_degrees - average_degree
+
+
 def check_for_error(sc, od):
     if sc.has_fault():
         error_description = od.error_report_description()
@@ -38,35 +65,35 @@ def lookup(device_list) -> Dict[Any, Dict[Any, Any]]:
     devices_position_in_chain = []
     for device in device_list:
         od = device['object_dictionary']
-        device_name = device['hardware_description']['device']['name']
+        device_name = device['device_name']
         devices_names_in_chain.append(device_name)
         device_address = device['info'].device_address
-        lookup[device_address] = dict()
-        lookup[device_address]['device_position'] = device['info'].position
+        device_lookup = lookup[device_address] = dict()
+        device_lookup['device_position'] = device['info'].position
         devices_position_in_chain.append(device['info'].position)
-        lookup[device_address]['device_name'] = device_name
+        device_lookup['device_name'] = device_name
 
         value_before_test = dict()
         value_before_test['commutation_angle_offset'] = od.commutation_angle_offset()
         value_before_test['commutation_offset_measurement_method'] = od.commutation_offset_measurement_method()
-        lookup[device_address]['value_before_test'] = value_before_test
+        device_lookup['value_before_test'] = value_before_test
 
         # Get the position controller encoder resolution
         encoder_config_object_index = stb.get_motion_encoder_config_index(od, position_control=True)
         resolution = od.parameter(encoder_config_object_index, 3)
-        lookup[device_address]['resolution'] = resolution
+        device_lookup['resolution'] = resolution
 
         # Get the commutation offset angle
         commutation_angle_offset_in_od = od.commutation_angle_offset()
-        lookup[device_address]['commutation_angle_offset'] = commutation_angle_offset_in_od
+        device_lookup['commutation_angle_offset'] = commutation_angle_offset_in_od
 
         # Get number of pole pairs
         pole_pairs = od.motor_specific_settings_pole_pairs()
-        lookup[device_address]['pole_pairs'] = pole_pairs
+        device_lookup['pole_pairs'] = pole_pairs
 
         # Get commutation offset detection state
         state = od.commutation_offset_state()
-        lookup[device_address]['state'] = state
+        device_lookup['state'] = state
 
     for i in range(len(devices_names_in_chain)):
         logger.info('{} at position {}'.format(devices_names_in_chain[i], devices_position_in_chain[i]))
@@ -162,17 +189,20 @@ class TestCommutationOffsetDetection:
             od = device['object_dictionary']
             sc = device['state_control']
             device_address = device['info'].device_address
-            mechanical_single_turn_resolution = lookup[device_address]['resolution']
+            device_lookup = lookup[device_address]
+            mechanical_single_turn_resolution = device_lookup['resolution']
             electrical_angle_resolution = 4096
-            device_position = lookup[device_address]['device_position']
-            device_name = lookup[device_address]['device_name']
+            deg_per_tick = 360 / electrical_angle_resolution
+            mechanical_deg_per_tick = 360 / mechanical_single_turn_resolution
+            device_position = device_lookup['device_position']
+            device_name = device_lookup['device_name']
             logger.info('running on {} at position {}'.format(device_name, device_position))
 
             # Check that the state is not In progress
-            initial_state = lookup[device_address]['state']
-            assert initial_state == OffsetDetectionState.OFFSET_VALID.value, \
+            initial_state = device_lookup['state']
+            assert initial_state == OFFSET_VALID_STATE, \
                 "Commutation offset state is {}. That's not a valid initial state for {} at position {}.".format(
-                 OffsetDetectionState(initial_state).name, device_name, device_position)
+                 OFFSET_DETECTION_STATE_NAMES.get(initial_state, initial_state), device_name, device_position)
 
             # Configure position profiler
             pph = ProfilePositionHandler(sc, od)
@@ -183,35 +213,34 @@ class TestCommutationOffsetDetection:
             profiler_timeout = 10
             pph.set_profiler_configuration(pph.VELOCITY_PARAMETERS_FRAME.MOTOR_SHAFT_FRAME, acceleration, deceleration,
                                            max_velocity, target_tolerance, profiler_timeout)
-            coh = somanet_oscmd_helpers.CommutationOffsetMeasurementHandler(od)
+            coh = oscmd_helpers.CommutationOffsetMeasurementHandler(od)
 
-            original_offset_value = lookup[device_address]['commutation_angle_offset']
+            original_offset_value = device_lookup['commutation_angle_offset']
 
             # Move to a set of mechanical positions before starting offset detection
-            number_of_mechanical_starting_positions = lookup[device_address]['pole_pairs'] * 1
-
-            method_0_offset_detection_error_degrees = []
-            method_1_offset_detection_error_degrees = []
-            method_2_offset_detection_error_degrees = []
+            number_of_mechanical_starting_positions = device_lookup['pole_pairs'] * 1
+            target_positions = [int(mechanical_single_turn_resolution * i / number_of_mechanical_starting_positions)
+                                for i in range(number_of_mechanical_starting_positions)]
 
-            method_0_measured_offset_degree_list = []
+            method_0_measured_offsets = []
             method_1_measured_offset_degree_list = []
             method_2_measured_offset_degree_list = []
 
             # Run offset detection method 0, and after it use the results as a good
             # estimation of commutation angle offset
 
+            set_offset = od.commutation_angle_offset
+            brake = od.brake_options_brake_status
+
             offset_detection_method = 0
-            logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: {}".format(offset_detection_method))
+            logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: %s", offset_detection_method)
             od.commutation_offset_measurement_method(offset_detection_method)
 
-            for i in range(number_of_mechanical_starting_positions):
+            for target_position in target_positions:
 
-                target_position = int(mechanical_single_turn_resolution * i / number_of_mechanical_starting_positions)
-
-                # set commutation angle offset to its original value because
-                od.commutation_offset_measurement_method(offset_detection_method)
-                od.commutation_angle_offset(original_offset_value)
+                # set commutation angle offset to its original value because the previous
+                # detection overwrote it, and reload the configuration to apply it
+                set_offset(original_offset_value)
                 stb.reload_drive_configuration(sc)
 
                 # move to different starting positions before offset detection
@@ -219,7 +248,7 @@ class TestCommutationOffsetDetection:
                 expected_position = target_position
 
                 # disengage brake
-                od.brake_options_brake_status(2)
+                brake(2)
                 time.sleep(0.2)
 
                 pph.enable_profiler()
@@ -229,37 +258,35 @@ class TestCommutationOffsetDetection:
                 sc.enable_operation()
 
                 # disengage brake
-                od.brake_options_brake_status(2)
+                brake(2)
                 time.sleep(0.2)
 
                 coh.start_procedure()
                 angle_offset = coh.check_response()
-                logger.debug("Starting point: {} [Degree Mechanical] \t offset: {} [Ticks] = {: 0.1f} [Degree Electric]"
-                             .format(int(target_position * 360 / mechanical_single_turn_resolution), angle_offset,
-                                     angle_offset * 360 / electrical_angle_resolution))
-
-                method_0_measured_offset_degree_list.append(angle_offset * 360 / electrical_angle_resolution)
+                logger.debug("Starting point: %d [Degree Mechanical] \t offset: %s [Ticks] = % 0.1f [Degree Electric]",
+                             target_position * mechanical_deg_per_tick, angle_offset, angle_offset * deg_per_tick)
 
-            average_method_0_measured_offset_degree = \
-                sum(method_0_measured_offset_degree_list) / len(method_0_measured_offset_degree_list)
-            logger.debug("average_method_0_measured_offset_degree: {: 0.1f}".format(
-                average_method_0_measured_offset_degree))
+                method_0_measured_offsets.append(angle_offset)
 
-            for i in range(len(method_0_measured_offset_degree_list)):
-                offset_error_degrees = method_0_measured_offset_degree_list[i] - average_method_0_measured_offset_degree
-                method_0_offset_detection_error_degrees.append(offset_error_degrees)
+            average_method_0_measured_offset_degree, method_0_offset_detection_error_degrees = \
+                compute_offset_errors(method_0_measured_offsets, electrical_angle_resolution)
+            logger.debug("average_method_0_measured_offset_degree: % 0.1f", average_method_0_measured_offset_degree)
 
             for offset_detection_method in range(1, 3, 1):
-                logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: {}".format(offset_detection_method))
-
-                for i in range(number_of_mechanical_starting_positions):
-
-                    target_position = int(mechanical_single_turn_resolution * i /
-                                          number_of_mechanical_starting_positions)
-
-                    # set commutation angle offset to its original value because
-                    od.commutation_offset_measurement_method(offset_detection_method)
-                    od.commutation_angle_offset(original_offset_value)
+                logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: %s", offset_detection_method)
+                od.commutation_offset_measurement_method(offset_detection_method)
+                # engage the brake for method 2, disengage it for the method which needs to move the rotor
+                brake_value = 1 if offset_detection_method == 2 else 2
+                if offset_detection_method == 1:
+                    measured_offset_degree_list = method_1_measured_offset_degree_list
+                else:
+                    measured_offset_degree_list = method_2_measured_offset_degree_list
+
+                for target_position in target_positions:
+
+                    # set commutation angle offset to its original value because the previous
+                    # detection overwrote it, and reload the configuration to apply it
+                    set_offset(original_offset_value)
                     stb.reload_drive_configuration(sc)
 
                     # move to different starting positions before offset detection
@@ -267,7 +294,7 @@ class TestCommutationOffsetDetection:
                     expected_position = target_position
 
                     # disengage brake
-                    od.brake_options_brake_status(2)
+                    brake(2)
                     time.sleep(0.2)
 
                     pph.enable_profiler()
@@ -276,41 +303,25 @@ class TestCommutationOffsetDetection:
                     sc.set_op_mode(sc.OP_MODES.COMMUTATION_OFFSET)
                     sc.enable_operation()
 
-                    # disengage the brake for the cases which need to move the rotor
-                    if offset_detection_method is 2:
-                        # engage brake
-                        od.brake_options_brake_status(1)
-                        time.sleep(0.2)
-                    else:
-                        # disengage brake
-                        od.brake_options_brake_status(2)
-                        time.sleep(0.2)
+                    brake(brake_value)
+                    time.sleep(0.2)
 
                     coh.start_procedure()
                     angle_offset = coh.check_response()
                     logger.debug(
-                        "Starting point: {} [Degree Mechanical] \t offset: {} [Ticks] = {: 0.1f} [Degree Electric]".
-                        format(int(target_position * 360 / mechanical_single_turn_resolution), angle_offset,
-                               angle_offset * 360 / electrical_angle_resolution))
-
-                    if offset_detection_method is 1:
-                        method_1_measured_offset_degree_list.append(angle_offset * 360 / electrical_angle_resolution)
-                    elif offset_detection_method is 2:
-                        method_2_measured_offset_degree_list.append(angle_offset * 360 / electrical_angle_resolution)
+                        "Starting point: %d [Degree Mechanical] \t offset: %s [Ticks] = % 0.1f [Degree Electric]",
+                        target_position * mechanical_deg_per_tick, angle_offset, angle_offset * deg_per_tick)
 
-            for i in range(len(method_1_measured_offset_degree_list)):
-                offset_error_degrees = method_1_measured_offset_degree_list[
-                                           i] - average_method_0_measured_offset_degree
-                method_1_offset_detection_error_degrees.append(offset_error_degrees)
+                    measured_offset_degree_list.append(angle_offset * deg_per_tick)
 
-            for i in range(len(method_2_measured_offset_degree_list)):
-                offset_error_degrees = method_2_measured_offset_degree_list[
-                                           i] - average_method_0_measured_offset_degree
-                method_2_offset_detection_error_degrees.append(offset_error_degrees)
+            method_1_offset_detection_error_degrees = \
+                np.asarray(method_1_measured_offset_degree_list) - average_method_0_measured_offset_degree
+            method_2_offset_detection_error_degrees = \
+                np.asarray(method_2_measured_offset_degree_list) - average_method_0_measured_offset_degree
 
-            logger.debug("method_0_offset_detection_error_degrees: {}".format(method_0_offset_detection_error_degrees))
-            logger.debug("method_1_offset_detection_error_degrees: {}".format(method_1_offset_detection_error_degrees))
-            logger.debug("method_2_offset_detection_error_degrees: {}".format(method_2_offset_detection_error_degrees))
+            logger.debug("method_0_offset_detection_error_degrees: %s", method_0_offset_detection_error_degrees)
+            logger.debug("method_1_offset_detection_error_degrees: %s", method_1_offset_detection_error_degrees)
+            logger.debug("method_2_offset_detection_error_degrees: %s", method_2_offset_detection_error_degrees)
 
             # Check for error
             if sc.has_fault():
@@ -323,17 +334,20 @@ class TestCommutationOffsetDetection:
                 error_description = od.error_report_description()
                 logger.warning("A warning is active: %s.", error_description)
 
-            assert abs(max(method_0_offset_detection_error_degrees)) < 7,\
+            # The error can be negative too, so check its magnitude
+            method_0_max_error_degrees = np.abs(method_0_offset_detection_error_degrees).max()
+            assert method_0_max_error_degrees < 7,\
                 'method 0 offset detection error is {: 0.1f} degrees (Maximum acceptable value is 7 for {} at' \
                 ' position {}.'.format(
-                max(method_0_offset_detection_error_degrees), device_name, device_position)
+                method_0_max_error_degrees, device_name, device_position)
 
-            assert abs(max(method_1_offset_detection_error_degrees)) < 7,\
+            method_1_max_error_degrees = np.abs(method_1_offset_detection_error_degrees).max()
+            assert method_1_max_error_degrees < 7,\
                 'method 1 offset detection error is {: 0.1f} degrees (Maximum acceptable value is 7 for {} at ' \
                 'position {}.'.format(
-                max(method_1_offset_detection_error_degrees), device_name, device_position)
+                method_1_max_error_degrees, device_name, device_position)
 
-    @pytest.mark.parametrize("command", [choice(['disable_voltage', 'disable_operation', 'shutdown']), 'quick_stop'])
+    @pytest.mark.parametrize("command", ['disable_voltage', 'disable_operation', 'shutdown', 'quick_stop'])
     def test_commutation_offset_detection_abort(self, mmw, device_list, lookup, cleanup, command):
         """
         Starts offset commutation procedure and aborts it before it's finished.
@@ -347,24 +361,25 @@ class TestCommutationOffsetDetection:
             od = device['object_dictionary']
             sc = device['state_control']
             device_address = device['info'].device_address
-            device_position = lookup[device_address]['device_position']
-            device_name = lookup[device_address]['device_name']
+            device_lookup = lookup[device_address]
+            device_position = device_lookup['device_position']
+            device_name = device_lookup['device_name']
             logger.info('running on {} at position {}'.format(device_name, device_position))
 
             # Check that the state is not In progress
-            initial_state = lookup[device_address]['state']
-            assert initial_state == OffsetDetectionState.OFFSET_VALID.value, \
+            initial_state = device_lookup['state']
+            assert initial_state == OFFSET_VALID_STATE, \
                 "Commutation offset state is {}. That's not a valid initial state on {} at position {}.".format(
-                 OffsetDetectionState(initial_state).name, device_name, device_position)
+                 OFFSET_DETECTION_STATE_NAMES.get(initial_state, initial_state), device_name, device_position)
 
-            coh = somanet_oscmd_helpers.CommutationOffsetMeasurementHandler(od)
+            coh = oscmd_helpers.CommutationOffsetMeasurementHandler(od)
 
-            original_offset_value = lookup[device_address]['commutation_angle_offset']
-            logging.debug("original_offset_value{}".format(original_offset_value))
+            original_offset_value = device_lookup['commutation_angle_offset']
+            logging.debug("original_offset_value %s", original_offset_value)
 
             # Run offset detection method 0, and abort it in 0.1 seconds
             for offset_detection_method in range(0, 3, 1):
-                logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: {}".format(offset_detection_method))
+                logging.debug("COMMUTATION ANGLE OFFSET DETECTION - Method: %s", offset_detection_method)
                 od.commutation_offset_measurement_method(offset_detection_method)
 
                 sc.set_op_mode(sc.OP_MODES.COMMUTATION_OFFSET)
@@ -376,12 +391,13 @@ class TestCommutationOffsetDetection:
 
                 coh.start_procedure()
                 time.sleep(0.1)
-                sc.shutdown()
+                # Abort the procedure with the state transition under test
+                getattr(sc, command)()
 
                 response = coh.check_response()
-                logging.debug("response: {}".format(response))
+                logging.debug("response: %s", response)
 
                 try:
                     coh.check_response()
-                except somanet_oscmd_helpers.OsCommandException as e:
+                except oscmd_helpers.OsCommandException as e:
                     logger.warning('os command did not abort properly:' + str(e))
@@ -16,7 +16,7 @@ It is recommended to use a standard way of importing:
 
 import re
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 from motion_master_wrapper import MotionMasterWrapper
 
 logger = logging.getLogger(__name__)
@@ -274,6 +274,20 @@ class ObjectDictionary:
             return_value = self.mmw.get_device_parameter_value(self.addr, index, subindex)
         return return_value
 
+    def set_values(self, entries: List[Tuple[_GetterSetter, Any]]):
+        """
+        Write several OD entries with a single Motion Master request.
+        Example:
+                    od.set_values([(od.profile_acceleration, 1000), (od.profile_deceleration, 1000)])
+
+        Parameters
+        ----------
+        entries : List[Tuple[_GetterSetter, Any]]
+            OD entries, as accessed through their attribute, with the value to write. They are written in order.
+        """
+        self.mmw.set_device_parameter_values(
+            self.addr, [(entry.index, entry.subindex, value) for entry, value in entries])
+
     def _add_method(self, function_name: str, index: int, subindex: int, entry):
         """
         Add a new attribute to this object with name "function_name"
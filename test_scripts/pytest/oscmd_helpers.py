@@ -9,17 +9,50 @@ __copyright__ = "Copyright 2019, Synapticon GmbH"
 __license__ = "Closed"
 __email__ = "support@synapticon.com"
 
+import asyncio
 import time
 import pytest
 import logging
+import statistics
+import struct
+import weakref
 
+from collections import defaultdict, deque
 from enum import Enum, unique
 
+logger = logging.getLogger(__name__)
+
+# Bounds of the interval used to poll the OS command response, in seconds, and its growth after each poll
+POLL_INTERVAL_MIN_S = 0.0002
+POLL_INTERVAL_MAX_S = 0.2
+POLL_INTERVAL_GROWTH = 1.3
+# OS command handler of every object dictionary, see `OsCmdHandler.for_od()`
+_OS_CMD_HANDLERS = weakref.WeakKeyDictionary()
+# Raw OS command, 8 unsigned bytes
+_COMMAND_STRUCT = struct.Struct('8B')
+# Big-endian values replied by OS commands, starting at byte 2 of the response
+_REPLY_U16 = struct.Struct('>H')
+_REPLY_U32 = struct.Struct('>I')
+
 
 class OsCommandException(Exception):
     """Exception for operations that just didn't work."""
     pass
 
+
+class OsCommandStatusError(Exception):
+    """Exception for OS command responses with a status that is not valid for the command.
+    It is not an `OsCommandException`: the drive misbehaved, the command didn't just fail.
+    """
+
+    def __init__(self, command, status):
+        super().__init__(command, status)
+        self.command = command
+        self.status = status
+
+    def __str__(self):
+        return "Not valid status for OS command {}: {}.".format(self.command.value, self.status)
+
 @unique
 class OsCmdModes(Enum):
     EXECUTE_NEXT_CMD = 0
@@ -52,6 +85,13 @@ class OsCmdStatus(Enum):
     IN_PROCESS_100 = 200
     CMD_IN_PROGRESS = 255
 
+_STATUS_OK_NOREPLY = OsCmdStatus.COMPLETED_NOERROR_NOREPLY.value
+_STATUS_OK_REPLY = OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value
+_STATUS_ERROR_NOREPLY = OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value
+_STATUS_ERROR_REPLY = OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value
+_STATUS_IN_PROGRESS = frozenset((OsCmdStatus.CMD_IN_PROGRESS.value,
+                                 *range(OsCmdStatus.IN_PROCESS_0.value, OsCmdStatus.IN_PROCESS_100.value + 1)))
+
 
 @unique
 class OsCmdErrorCodes(Enum):
@@ -61,20 +101,68 @@ class OsCmdErrorCodes(Enum):
     UNSUPPORTED_CMD = 254
     RESERVED_FOR_EXTENSION = 255
 
+# Names of the error codes, indexed by value
+_OS_ERROR_NAMES = {item.value: item.name for item in OsCmdErrorCodes}
+
+
+def _as_bytes(response):
+    """Return the raw OS command response as bytes, without copying it if it already is."""
+    return response if isinstance(response, (bytes, bytearray)) else bytes(response)
+
+
+def _reply_u8(response):
+    """Reply of OS commands returning a single byte."""
+    return response[2]
+
+
+def _reply_u16(response):
+    """Reply of OS commands returning a big-endian 16 bits value."""
+    return _REPLY_U16.unpack_from(response, 2)[0]
+
+
+def _reply_u32(response):
+    """Reply of OS commands returning a big-endian 32 bits value."""
+    return _REPLY_U32.unpack_from(response, 2)[0]
+
 
 class OsCmdHandler:
     """Handler to use OS commands.
     """
 
+    __slots__ = ('od', 'current_command', '_cmd_buf', 'current_mode', 'status_in_progress')
+
     MODES = OsCmdModes
     STATUS = OsCmdStatus
+    # Recent completion times of every OS command (keyed by command ID), used to seed the polling interval
+    completion_times = defaultdict(lambda: deque(maxlen=16))
 
     def __init__(self, od):
         self.od = od
         self.current_command = None
+        # Reused for every command instead of building a new list each time
+        self._cmd_buf = bytearray(_COMMAND_STRUCT.size)
         self.current_mode = self.MODES.EXECUTE_NEXT_CMD
-        self.status_in_progress = [self.STATUS.CMD_IN_PROGRESS.value] + list(
-            range(self.STATUS.IN_PROCESS_0.value, self.STATUS.IN_PROCESS_100.value + 1))
+        self.status_in_progress = _STATUS_IN_PROGRESS
+
+    @classmethod
+    def for_od(cls, od):
+        """Get the OS command handler of an object dictionary, it is created on first use.
+        All the command handlers of a device share it, so they see the same active command.
+
+        Parameters
+        ----------
+        od : ObjectDictionary
+            Object dictionary of the device.
+
+        Returns
+        -------
+        och : OsCmdHandler
+            OS command handler of the device.
+        """
+        och = _OS_CMD_HANDLERS.get(od)
+        if och is None:
+            och = _OS_CMD_HANDLERS[od] = cls(od)
+        return och
 
     def change_mode(self, mode):
         """Change OS command mode (0x1024:0).
@@ -98,46 +186,244 @@ class OsCmdHandler:
         command : List
             List with the raw OS command.
         """
+        self.execute_command_bytes(*command)
+
+    def execute_command_bytes(self, b0, b1=0, b2=0, b3=0, b4=0, b5=0, b6=0, b7=0):
+        """Execute a raw OS command given byte by byte, missing bytes are 0.
+        See `execute_command()`.
+
+        Parameters
+        ----------
+        b0 : int
+            OS command ID.
+        b1, b2, b3, b4, b5, b6, b7 : int
+            OS command data bytes.
+        """
         if self.current_command is not None:
             pytest.fail("OS command request was received when another one was already in progress.")
             return
 
-        self.current_command = command
-        """
-        question: what is "os_command_command"? where is it defined?
-        """
-        self.od.os_command_command(bytes(command))
+        _COMMAND_STRUCT.pack_into(self._cmd_buf, 0, b0, b1, b2, b3, b4, b5, b6, b7)
+        self.current_command = bytes(self._cmd_buf)
+        self.od.os_command_command(self.current_command)
 
     def get_response(self):
         """Check the current OS command response.
 
         Returns
         -------
-        response : List
-            List with the raw OS command response.
+        response : bytes
+            Raw OS command response.
         """
-        response = list(self.od.os_command_response())
+        response = _as_bytes(self.od.os_command_response())
         if response[0] not in self.status_in_progress:
             self.current_command = None
         return response
 
+    def _poll(self, timeout):
+        """Generator polling the OS command response until the current command is not in progress anymore.
+        The polling interval starts at half the usual completion time of the command and grows by
+        `POLL_INTERVAL_GROWTH` up to `POLL_INTERVAL_MAX_S`, so fast commands return quickly while long procedures
+        don't poll needlessly. The completion is detected at most about 30 % of the command duration late.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time to wait for the command to complete, in seconds.
+
+        Yields
+        ------
+        delay : float
+            Time to sleep before the next poll, in seconds.
+
+        Returns
+        -------
+        response : bytes or None
+            Raw OS command response, None if the command was still in progress after the timeout. The command is
+            not considered active anymore in both cases.
+        """
+        command_id = self.current_command[0] if self.current_command is not None else None
+        history = self.completion_times[command_id]
+        delay = POLL_INTERVAL_MIN_S
+        if history:
+            delay = min(max(statistics.median(history) / 2, POLL_INTERVAL_MIN_S), POLL_INTERVAL_MAX_S)
+        # Bound locally, this loop can run thousands of times for long procedures
+        od_response = self.od.os_command_response
+        in_progress = self.status_in_progress
+        monotonic_ns = time.monotonic_ns
+        start_ns = monotonic_ns()
+        deadline_ns = start_ns + int(timeout * 1e9)
+        while True:
+            response = _as_bytes(od_response())
+            if response[0] not in in_progress:
+                self.current_command = None
+                history.append((monotonic_ns() - start_ns) * 1e-9)
+                return response
+            if monotonic_ns() > deadline_ns:
+                # Give up on the command, otherwise it would block the next ones of the device
+                self.current_command = None
+                return None
+            yield delay
+            delay = min(delay * POLL_INTERVAL_GROWTH, POLL_INTERVAL_MAX_S)
+
+    def wait_for_response(self, timeout):
+        """Poll the OS command response until the current command is not in progress anymore.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time to wait for the command to complete, in seconds.
+
+        Returns
+        -------
+        response : bytes or None
+            Raw OS command response, None if the command was still in progress after the timeout.
+        """
+        if hasattr(self.od, 'wait_for'):
+            return self._wait_for_change(timeout)
+        poll = self._poll(timeout)
+        try:
+            while True:
+                time.sleep(next(poll))
+        except StopIteration as e:
+            return e.value
+
+    def _wait_for_change(self, timeout):
+        """Wait for the OS command response with the `wait_for(index, subindex, timeout)` method of the object
+        dictionary, which blocks until the value of an entry changes or the timeout expires, instead of polling.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time to wait for the command to complete, in seconds.
+
+        Returns
+        -------
+        response : bytes or None
+            Raw OS command response, None if the command was still in progress after the timeout.
+        """
+        od_response = self.od.os_command_response
+        deadline_ns = time.monotonic_ns() + int(timeout * 1e9)
+        while True:
+            response = _as_bytes(od_response())
+            if response[0] not in self.status_in_progress:
+                self.current_command = None
+                return response
+            remaining_ns = deadline_ns - time.monotonic_ns()
+            if remaining_ns < 0:
+                self.current_command = None
+                return None
+            self.od.wait_for(od_response.index, od_response.subindex, remaining_ns * 1e-9)
+
+    async def wait_for_response_async(self, timeout):
+        """Coroutine version of `wait_for_response()`, other tasks run while the command is in progress.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time to wait for the command to complete, in seconds.
+
+        Returns
+        -------
+        response : bytes or None
+            Raw OS command response, None if the command was still in progress after the timeout.
+        """
+        poll = self._poll(timeout)
+        try:
+            while True:
+                await asyncio.sleep(next(poll))
+        except StopIteration as e:
+            return e.value
+
+    def wait(self, command, timeout, parse_reply=None, extra_error_names=None, fail_on_timeout=True):
+        """Wait until the response of an OS command is received or until timeout happens, and check it.
+
+        Parameters
+        ----------
+        command : OsCmdCommand
+            OS command that is waited for, used in the error messages.
+        timeout : float
+            Maximum time to wait for the command to complete, in seconds.
+        parse_reply : callable or None
+            Function returning the result of the command from the raw response. If None, the command is expected to
+            complete without reply.
+        extra_error_names : dict or None
+            Names of the command specific error codes, indexed by value.
+        fail_on_timeout : bool
+            Fail the test if the command times out, raise an `OsCommandException` otherwise.
+
+        Returns
+        -------
+        response : Any
+            Result of `parse_reply`, True if the command has no reply.
+
+        Raises
+        ------
+        OsCommandException
+            If the command completed with an error.
+        OsCommandStatusError
+            If the response status is not valid for the command.
+        """
+        return self._check_response(self.wait_for_response(timeout), command, timeout, parse_reply, extra_error_names,
+                                    fail_on_timeout)
+
+    async def wait_async(self, command, timeout, parse_reply=None, extra_error_names=None, fail_on_timeout=True):
+        """Coroutine version of `wait()`, other tasks run while the command is in progress.
+        Commands of different devices can be waited for concurrently, e.g. with `asyncio.gather()`.
+        """
+        response = await self.wait_for_response_async(timeout)
+        return self._check_response(response, command, timeout, parse_reply, extra_error_names, fail_on_timeout)
+
+    @staticmethod
+    def _check_response(response, command, timeout, parse_reply, extra_error_names, fail_on_timeout):
+        """Check the final response of an OS command, see `wait()`."""
+        if response is None:
+            message = "OS command status was in progress for {} seconds.".format(timeout)
+            if fail_on_timeout:
+                pytest.fail(message)
+            raise OsCommandException(message)
+
+        if parse_reply is None and response[0] == _STATUS_OK_NOREPLY:
+            return True
+        elif parse_reply is not None and response[0] == _STATUS_OK_REPLY:
+            return parse_reply(response)
+        elif response[0] == _STATUS_ERROR_REPLY:
+            os_error_code = _OS_ERROR_NAMES.get(response[2])
+            if os_error_code is None and extra_error_names is not None:
+                os_error_code = extra_error_names.get(response[2])
+            if os_error_code is None:
+                pytest.fail("OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
+            raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
+                response[2], os_error_code))
+        elif response[0] == _STATUS_ERROR_NOREPLY:
+            raise OsCommandException("OS command returned an error (no OS error code).")
+        else:
+            raise OsCommandStatusError(command, response[0])
+
     def get_active_command(self):
         """Get the currently active OS command.
 
         Returns
         -------
-        current_command : List or None
+        current_command : bytes or None
             Returns the raw OS command if it was not read to be finished. Otherwise returns None.
         """
         return self.current_command
 
 
+def _register_access(write, slave_address):
+    """Byte 2 of the encoder register communication command: bit 0 selects a write, bits 1 to 7 the BiSS slave."""
+    return int(write) | slave_address << 1
+
+
 class EncoderRegisterCommunicationHandler:
     """Handler to use encoder register communication.
     """
 
+    __slots__ = ('och', 'timeout')
+
     def __init__(self, od, timeout=1):
-        self.och = OsCmdHandler(od)
+        self.och = OsCmdHandler.for_od(od)
         self.timeout = timeout
 
     def read_register(self, encoder_connector, register_address, slave_address=0):
@@ -152,12 +438,8 @@ class EncoderRegisterCommunicationHandler:
         slave_address : int
             BiSS slave address.
         """
-        b0 = OsCmdCommand.ENCODER_REGISTER_COMMUNICATION.value
-        b1 = encoder_connector
-        b2 = 0 | slave_address << 1
-        b3 = register_address
-        command = [b0, b1, b2, b3, 0, 0, 0, 0]
-        self.och.execute_command(command)
+        self.och.execute_command_bytes(OsCmdCommand.ENCODER_REGISTER_COMMUNICATION.value, encoder_connector,
+                                       _register_access(False, slave_address), register_address)
 
     def write_register(self, encoder_connector, register_address, register_value, slave_address=0):
         """Send command to write the value of a BiSS register.
@@ -173,13 +455,8 @@ class EncoderRegisterCommunicationHandler:
         slave_address : int
             BiSS slave address.
         """
-        b0 = OsCmdCommand.ENCODER_REGISTER_COMMUNICATION.value
-        b1 = encoder_connector
-        b2 = 1 | slave_address << 1
-        b3 = register_address
-        b4 = register_value
-        command = [b0, b1, b2, b3, b4, 0, 0, 0]
-        self.och.execute_command(command)
+        self.och.execute_command_bytes(OsCmdCommand.ENCODER_REGISTER_COMMUNICATION.value, encoder_connector,
+                                       _register_access(True, slave_address), register_address, register_value)
 
     def check_response(self):
         """Wait until a response is received or until timeout happens.
@@ -189,30 +466,12 @@ class EncoderRegisterCommunicationHandler:
         response : int
             Register communication response.
         """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                return response[2]
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.ENCODER_REGISTER_COMMUNICATION.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
+        return self.och.wait(OsCmdCommand.ENCODER_REGISTER_COMMUNICATION, self.timeout, parse_reply=_reply_u8)
+
+    async def check_response_async(self):
+        """Coroutine version of `check_response()`."""
+        return await self.och.wait_async(OsCmdCommand.ENCODER_REGISTER_COMMUNICATION, self.timeout,
+                                         parse_reply=_reply_u8)
 
 
 @unique
@@ -222,12 +481,19 @@ class IcmuCalibrationModes(Enum):
     STANDARD_MODE = 2
 
 
+def _icmu_mode_selection(encoder_connector, mode):
+    """Byte 1 of the iC-MU calibration command: bits 0 to 2 select the encoder connector, bits 3 to 7 the mode."""
+    return encoder_connector | mode.value << 3
+
+
 class IcmuCalibrationModeHandler:
     """Handler to enable iC-MU calibration modes.
     """
 
+    __slots__ = ('och', 'timeout')
+
     def __init__(self, od, timeout=1):
-        self.och = OsCmdHandler(od)
+        self.och = OsCmdHandler.for_od(od)
         self.timeout = timeout
 
     def enable_mode(self, encoder_connector, mode):
@@ -240,10 +506,8 @@ class IcmuCalibrationModeHandler:
         mode : Enum
             iC-MU calibration mode.
         """
-        b0 = OsCmdCommand.ICMU_CALIBRATION.value
-        b1 = encoder_connector | mode.value << 3
-        command = [b0, b1, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+        self.och.execute_command_bytes(OsCmdCommand.ICMU_CALIBRATION.value,
+                                       _icmu_mode_selection(encoder_connector, mode))
 
     def check_response(self):
         """Wait until a response is received or until timeout happens.
@@ -253,30 +517,11 @@ class IcmuCalibrationModeHandler:
         response : bool
             True if the mode was changed successfully.
         """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_NOREPLY.value:
-                return True
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.ICMU_CALIBRATION.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
+        return self.och.wait(OsCmdCommand.ICMU_CALIBRATION, self.timeout)
+
+    async def check_response_async(self):
+        """Coroutine version of `check_response()`."""
+        return await self.och.wait_async(OsCmdCommand.ICMU_CALIBRATION, self.timeout)
 
 
 @unique
@@ -297,13 +542,17 @@ class OsCmd3ErrorCodes(Enum):
     DURATION_VALUE_ERROR = 2
     DATA_INDEX_VALUE_ERROR = 3
 
+_OS_CMD3_ERROR_NAMES = {item.value: item.name for item in OsCmd3ErrorCodes}
+
 
 class HrdStreamingHandler:
     """Handler to use High resolution data streaming.
     """
 
+    __slots__ = ('och', 'timeout')
+
     def __init__(self, od, timeout=5):
-        self.och = OsCmdHandler(od)
+        self.och = OsCmdHandler.for_od(od)
         self.timeout = timeout
 
     def configure_stream(self, data_index, duration_in_ms):
@@ -316,22 +565,18 @@ class HrdStreamingHandler:
         duration_in_ms : int
             Duration of the stream in milliseconds.
         """
-        self.timeout = duration_in_ms * 1000 + 1
-        b0 = OsCmdCommand.OSCMD_HRD_STREAMING.value
-        b1 = HrdStreamingActions.CONFIGURE_STREAM.value
-        b2 = data_index.value
-        b3 = (duration_in_ms >> 8) & 0xff
-        b4 = duration_in_ms & 0xff
-        command = [b0, b1, b2, b3, b4, 0, 0, 0]
-        self.och.execute_command(command)
+        # Streaming completes after the stream duration, allow one more second for the response
+        self.timeout = duration_in_ms / 1000 + 1
+        self.och.execute_command_bytes(OsCmdCommand.OSCMD_HRD_STREAMING.value,
+                                       HrdStreamingActions.CONFIGURE_STREAM.value, data_index.value,
+                                       *duration_in_ms.to_bytes(2, 'big'))
 
     def start_stream(self):
         """Send command to start the streaming.
         """
         b0 = OsCmdCommand.OSCMD_HRD_STREAMING.value
         b1 = HrdStreamingActions.START_STREAM.value
-        command = [b0, b1, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+        self.och.execute_command_bytes(b0, b1)
 
     def check_response(self):
         """Wait until a response is received or until timeout happens.
@@ -341,138 +586,74 @@ class HrdStreamingHandler:
         response : bool
             True if the mode was changed successfully.
         """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_NOREPLY.value:
-                return True
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                elif response[2] in [item.value for item in OsCmd3ErrorCodes]:
-                    os_error_code = OsCmd3ErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.OSCMD_HRD_STREAMING.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class PhaseOrderDetectionHandler:
-    """Handler to get motor phase order.
+        return self.och.wait(OsCmdCommand.OSCMD_HRD_STREAMING, self.timeout,
+                             extra_error_names=_OS_CMD3_ERROR_NAMES)
+
+    async def check_response_async(self):
+        """Coroutine version of `check_response()`."""
+        return await self.och.wait_async(OsCmdCommand.OSCMD_HRD_STREAMING, self.timeout,
+                                         extra_error_names=_OS_CMD3_ERROR_NAMES)
+
+
+class _ProcedureHandler:
+    """Base of the handlers of OS commands that run a procedure on the drive.
+    Subclasses define the command and how its reply is parsed.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ('och', 'timeout')
+
+    COMMAND = None
+    DEFAULT_TIMEOUT = 25
+    # Function returning the result of the procedure from the raw response, None if the command has no reply
+    parse_reply = None
+    # Names of the command specific error codes, indexed by value
+    extra_error_names = None
+    fail_on_timeout = True
+
+    def __init__(self, od, timeout=None):
+        self.och = OsCmdHandler.for_od(od)
+        self.timeout = self.DEFAULT_TIMEOUT if timeout is None else timeout
 
     def start_procedure(self):
         """Send command to start procedure.
         """
-        b0 = OsCmdCommand.MOTOR_PHASE_ORDER_DETECTION.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+        self.och.execute_command_bytes(self.COMMAND.value)
 
     def check_response(self):
         """Wait until a response is received or until timeout happens.
 
         Returns
         -------
-        response : int
-            Motor phases order.
+        response : int or bool
+            Result of the procedure (see the handler), True if the command has no reply.
         """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                motor_phases_order = response[2]
-                return motor_phases_order
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.COMMUTATION_OFFSET_MEASUREMENT.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class CommutationOffsetMeasurementHandler:
-    """Handler to get the commutation offset and the motor phase order.
+        return self.och.wait(self.COMMAND, self.timeout, self.parse_reply, self.extra_error_names,
+                             self.fail_on_timeout)
+
+    async def check_response_async(self):
+        """Coroutine version of `check_response()`."""
+        return await self.och.wait_async(self.COMMAND, self.timeout, self.parse_reply, self.extra_error_names,
+                                         self.fail_on_timeout)
+
+
+class PhaseOrderDetectionHandler(_ProcedureHandler):
+    """Handler to get motor phase order, returned by `check_response()`.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        """
-        byte 0 is set to 5. 
-        I guess byte 0 shows what is the OsCmd
-        """
-        b0 = OsCmdCommand.COMMUTATION_OFFSET_MEASUREMENT.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.MOTOR_PHASE_ORDER_DETECTION
+    parse_reply = staticmethod(_reply_u8)
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
 
-        Returns
-        -------
-        response : int, int
-            Angle offset value and motor phases order.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                angle_offset = response[2] << 8 | response[3]
-                return angle_offset
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.COMMUTATION_OFFSET_MEASUREMENT.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
+class CommutationOffsetMeasurementHandler(_ProcedureHandler):
+    """Handler to get the commutation angle offset, returned by `check_response()`.
+    """
+
+    __slots__ = ()
+
+    COMMAND = OsCmdCommand.COMMUTATION_OFFSET_MEASUREMENT
+    parse_reply = staticmethod(_reply_u16)
 
 
 @unique
@@ -487,155 +668,94 @@ class OsCmd6ErrorCodes(Enum):
     OPEN_FET_C_HIGH = 7
     OPEN_FET_C_LOW = 8
 
+_OS_CMD6_ERROR_NAMES = {item.value: item.name for item in OsCmd6ErrorCodes}
+
+
+@unique
+class OpenLoopFieldModeParameters(Enum):
+    STARTING_ANGLE = 0
+    ENDING_ANGLE = 1
+    MAX_ROTATIONAL_SPEED = 2
+    ROTATIONAL_ACCELERATION = 3
+    LENGTH_START = 4
+    LENGTH_END = 5
+    LENGTH_SPEED = 6
+
 
 class OpenLoopFieldModeHandler:
     """Handler to work with "open loop field mode" feature
     """
 
+    __slots__ = ('och', 'timeout')
+
     def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
+        self.och = OsCmdHandler.for_od(od)
         self.timeout = timeout
 
-    def set_starting_angle_milli_radian(self, angle_start_milli_radian):
-        """Set starting angle of OpenLoopFieldMode profiler in [milli-radian]
-        """
+    def _set_parameter(self, parameter, value):
+        """Send command to set a parameter of the OpenLoopFieldMode profiler.
 
+        Parameters
+        ----------
+        parameter : OpenLoopFieldModeParameters
+            Profiler parameter to set.
+        value : int
+            Parameter value, sent as big-endian 32 bits in bytes 2 to 5.
         """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
+        self.och.execute_command_bytes(OsCmdCommand.OPEN_LOOP_FIELD_MODE.value, parameter.value,
+                                       *(value & 0xFFFFFFFF).to_bytes(4, 'big'))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("sent command: %s", list(self.och.get_active_command()))
+
+    def set_starting_angle_milli_radian(self, angle_start_milli_radian):
+        """Set starting angle of OpenLoopFieldMode profiler in [milli-radian]
         """
-        b0 = 2
-
-        b1 = 0
-        value = angle_start_milli_radian
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        self.och.execute_command(command)
-        logging.info("sent command: {}".format(command))
+        self._set_parameter(OpenLoopFieldModeParameters.STARTING_ANGLE, angle_start_milli_radian)
 
     def set_ending_angle_milli_radian(self, angle_end_milli_radian):
         """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
         """
-
-        """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
-        """
-        b0 = 2
-
-        b1 = 1
-        value = angle_end_milli_radian
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-
-        self.och.execute_command(command)
+        self._set_parameter(OpenLoopFieldModeParameters.ENDING_ANGLE, angle_end_milli_radian)
 
     def set_max_rotational_speed_rad_per_second(self, max_rotational_speed_rad_per_second):
-        """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
+        """Set maximum rotational speed of OpenLoopFieldMode profiler in [rad/s]
         """
-
-        """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
-        """
-        b0 = 2
-
-        b1 = 2
-        value = max_rotational_speed_rad_per_second
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-        self.och.execute_command(command)
+        self._set_parameter(OpenLoopFieldModeParameters.MAX_ROTATIONAL_SPEED, max_rotational_speed_rad_per_second)
 
     def set_rotational_acceleration_rad_per_squared_second(self, rotational_acceleration_rad_per_squared_second):
-        """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
+        """Set rotational acceleration of OpenLoopFieldMode profiler in [rad/s^2]
         """
-
-        """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
-        """
-        b0 = 2
-
-        b1 = 3
-        value = rotational_acceleration_rad_per_squared_second
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-        self.och.execute_command(command)
+        self._set_parameter(OpenLoopFieldModeParameters.ROTATIONAL_ACCELERATION,
+                            rotational_acceleration_rad_per_squared_second)
 
     def set_length_start_per_thousand_rated_current(self, length_start_per_thousand_rated_current):
-        """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
+        """Set starting field length of OpenLoopFieldMode profiler in [per thousand of rated current]
         """
-
-        """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
-        """
-        b0 = 2
-
-        b1 = 4
-        value = length_start_per_thousand_rated_current
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-        self.och.execute_command(command)
+        self._set_parameter(OpenLoopFieldModeParameters.LENGTH_START, length_start_per_thousand_rated_current)
 
     def set_length_end_per_thousand_rated_current(self, length_end_per_thousand_rated_current):
-        """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
-        """
-
-        """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
+        """Set ending field length of OpenLoopFieldMode profiler in [per thousand of rated current]
         """
-        b0 = 2
-
-        b1 = 5
-        value = length_end_per_thousand_rated_current
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-        self.och.execute_command(command)
+        self._set_parameter(OpenLoopFieldModeParameters.LENGTH_END, length_end_per_thousand_rated_current)
 
     def set_length_speed_per_thousand_rated_current_per_second(self, length_speed_per_thousand_rated_current_per_second):
-        """Set ending angle of OpenLoopFieldMode profiler in [milli-radian]
+        """Set field length speed of OpenLoopFieldMode profiler in [per thousand of rated current per second]
         """
+        self._set_parameter(OpenLoopFieldModeParameters.LENGTH_SPEED,
+                            length_speed_per_thousand_rated_current_per_second)
 
+    def configure_profiler(self, angle_start_milli_radian, angle_end_milli_radian, max_rotational_speed_rad_per_second,
+                           rotational_acceleration_rad_per_squared_second, length_start_per_thousand_rated_current,
+                           length_end_per_thousand_rated_current, length_speed_per_thousand_rated_current_per_second):
+        """Set all the parameters of the OpenLoopFieldMode profiler, see the `set_*()` methods for the units.
+        The OS command takes a single parameter, so each one is sent as soon as the previous one completed.
         """
-        b0 is the index of os_command it shows that os_command_2 which is related to
-        open loop field mode is selected
-        """
-        b0 = 2
-
-        b1 = 6
-        value = length_speed_per_thousand_rated_current_per_second
-        b5 = value & 0x000000FF
-        b4 = (value & 0x0000FF00) >> 8
-        b3 = (value & 0x00FF0000) >> 16
-        b2 = (value & 0xFF000000) >> 24
-        command = [b0, b1, b2, b3, b4, b5, 0, 0]
-        logging.info("sent command: {}".format(command))
-        self.och.execute_command(command)
+        values = (angle_start_milli_radian, angle_end_milli_radian, max_rotational_speed_rad_per_second,
+                  rotational_acceleration_rad_per_squared_second, length_start_per_thousand_rated_current,
+                  length_end_per_thousand_rated_current, length_speed_per_thousand_rated_current_per_second)
+        for parameter, value in zip(OpenLoopFieldModeParameters, values):
+            self._set_parameter(parameter, value)
+            self.get_response()
 
     def enable_open_loop_field_mode(self, device):
         """ enable open loop field mode """
@@ -653,275 +773,58 @@ class OpenLoopFieldModeHandler:
            response : int
                Number of pole pairs.
        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_NOREPLY.value:
-                return True
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.OPEN_PHASE_DETECTION.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class OpenPhaseDetectionHandler:
-    """Handler to check if there are open phases.
+        return self.och.wait(OsCmdCommand.OPEN_LOOP_FIELD_MODE, self.timeout)
+
+
+class OpenPhaseDetectionHandler(_ProcedureHandler):
+    """Handler to check if there are open phases, `check_response()` raises an error if so.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        b0 = OsCmdCommand.OPEN_PHASE_DETECTION.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.OPEN_PHASE_DETECTION
+    extra_error_names = _OS_CMD6_ERROR_NAMES
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
 
-        Returns
-        -------
-        response : int
-            Number of pole pairs.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_NOREPLY.value:
-                return True
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                elif response[2] in [item.value for item in OsCmd6ErrorCodes]:
-                    os_error_code = OsCmd6ErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.OPEN_PHASE_DETECTION.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class PolePairDetectionHandler:
-    """Handler to get the number of pole pairs.
+class PolePairDetectionHandler(_ProcedureHandler):
+    """Handler to get the number of pole pairs, returned by `check_response()`.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        b0 = OsCmdCommand.POLE_PAIR_DETECTION.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.POLE_PAIR_DETECTION
+    parse_reply = staticmethod(_reply_u8)
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
 
-        Returns
-        -------
-        response : int
-            Number of pole pairs.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                return response[2]
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.POLE_PAIR_DETECTION.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class PhaseResistanceMeasurementHandler:
-    """Handler to get the phase resistance.
+class PhaseResistanceMeasurementHandler(_ProcedureHandler):
+    """Handler to get the phase resistance, returned by `check_response()`.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        b0 = OsCmdCommand.PHASE_RESISTANCE_MEASUREMENT.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.PHASE_RESISTANCE_MEASUREMENT
+    parse_reply = staticmethod(_reply_u32)
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
 
-        Returns
-        -------
-        response : int
-            Phase resistance.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                phase_resistance = response[2] << 24 | response[3] << 16 | response[4] << 8 | response[5]
-                return phase_resistance
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.PHASE_RESISTANCE_MEASUREMENT.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class PhaseInductanceMeasurementHandler:
-    """Handler to get the phase inductance.
+class PhaseInductanceMeasurementHandler(_ProcedureHandler):
+    """Handler to get the phase inductance, returned by `check_response()`.
+    A timeout raises an `OsCommandException`.
     """
 
-    def __init__(self, od, timeout=60):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        b0 = OsCmdCommand.PHASE_INDUCTANCE_MEASUREMENT.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.PHASE_INDUCTANCE_MEASUREMENT
+    DEFAULT_TIMEOUT = 60
+    parse_reply = staticmethod(_reply_u32)
+    fail_on_timeout = False
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
 
-        Returns
-        -------
-        response : int
-            Phase inductance.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                phase_inductance = response[2] << 24 | response[3] << 16 | response[4] << 8 | response[5]
-                return phase_inductance
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.PHASE_INDUCTANCE_MEASUREMENT.value, response[0]))
-
-            if time.time() > timeout:
-                raise OsCommandException("OS command status was in progress for {} seconds.".format(self.timeout))
-
-
-class TorqueConstantMeasurementHandler:
-    """Handler to get the torque constant.
+class TorqueConstantMeasurementHandler(_ProcedureHandler):
+    """Handler to get the torque constant, returned by `check_response()`.
     """
 
-    def __init__(self, od, timeout=25):
-        self.och = OsCmdHandler(od)
-        self.timeout = timeout
+    __slots__ = ()
 
-    def start_procedure(self):
-        """Send command to start procedure.
-        """
-        b0 = OsCmdCommand.TORQUE_CONSTANT_MEASUREMENT.value
-        command = [b0, 0, 0, 0, 0, 0, 0, 0]
-        self.och.execute_command(command)
+    COMMAND = OsCmdCommand.TORQUE_CONSTANT_MEASUREMENT
+    parse_reply = staticmethod(_reply_u32)
 
-    def check_response(self):
-        """Wait until a response is received or until timeout happens.
-
-        Returns
-        -------
-        response : int
-            Torque constant.
-        """
-        timeout = time.time() + self.timeout
-        while True:
-            response = self.och.get_response()
-            time.sleep(0.010)
-            if response[0] is OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value:
-                torque_constant = response[2] << 24 | response[3] << 16 | response[4] << 8 | response[5]
-                return torque_constant
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_WITHREPLY.value:
-                if response[2] in [item.value for item in OsCmdErrorCodes]:
-                    os_error_code = OsCmdErrorCodes(response[2]).name
-                    raise OsCommandException("OS command returned an error (OS error code {}: {}).".format(
-                        response[2], os_error_code))
-                else:
-                    pytest.fail(
-                        "OS command returned an error, but the OS error code is unknown ({}).".format(response[2]))
-            elif response[0] is OsCmdStatus.COMPLETED_WITHERROR_NOREPLY.value:
-                raise OsCommandException("OS command returned an error (no OS error code).")
-            elif response[0] in self.och.status_in_progress:
-                pass
-            else:
-                pytest.fail("Not valid status for OS command {}: {}.".format(
-                    OsCmdCommand.TORQUE_CONSTANT_MEASUREMENT.value, response[0]))
-
-            if time.time() > timeout:
-                pytest.fail("OS command status was in progress for {} seconds.".format(self.timeout))
@@ -0,0 +1,74 @@
+"""
+OS command helpers test, runs without a device
+"""
+import pytest
+import oscmd_helpers
+
+
+class FakeObjectDictionary:
+    """Object dictionary whose OS command stays in progress until `complete()` is called."""
+
+    def __init__(self):
+        self.commands = []
+        self.response = bytes([oscmd_helpers.OsCmdStatus.CMD_IN_PROGRESS.value] + [0] * 7)
+
+    def os_command_command(self, command):
+        self.commands.append(command)
+
+    def os_command_response(self):
+        return self.response
+
+    def complete(self, reply):
+        self.response = bytes([oscmd_helpers.OsCmdStatus.COMPLETED_NOERROR_WITHREPLY.value, 0, reply] + [0] * 5)
+
+
+class FakeObjectDictionaryWaitFor(FakeObjectDictionary):
+    """Fake object dictionary that blocks on `wait_for()` instead of being polled."""
+
+    def os_command_response(self):
+        return self.response
+
+    def wait_for(self, index, subindex, timeout):
+        pass
+
+
+# Entry methods of the object dictionary know their index and subindex
+FakeObjectDictionaryWaitFor.os_command_response.index = 0x1023
+FakeObjectDictionaryWaitFor.os_command_response.subindex = 3
+
+
+# The tests don't use any device, don't reset their faults
+@pytest.fixture(autouse=True)
+def clear_fault():
+    pass
+
+
+@pytest.fixture(autouse=True)
+def skip_if_no_devices():
+    pass
+
+
+class TestOsCmdHelpers:
+    """Verifies the OS command handling shared by the handlers of a device.
+    """
+
+    @pytest.mark.parametrize('od_class', [FakeObjectDictionary, FakeObjectDictionaryWaitFor])
+    def test_command_after_timeout(self, od_class):
+        """
+        A command that timed out doesn't block the next OS commands of the device.
+        """
+        od = od_class()
+        inductance = oscmd_helpers.PhaseInductanceMeasurementHandler(od, timeout=0.01)
+        inductance.start_procedure()
+        with pytest.raises(oscmd_helpers.OsCommandException):
+            inductance.check_response()
+        assert inductance.och.get_active_command() is None
+
+        pole_pairs = oscmd_helpers.PolePairDetectionHandler(od, timeout=0.01)
+        assert pole_pairs.och is inductance.och
+        pole_pairs.start_procedure()
+        od.complete(7)
+        assert pole_pairs.check_response() == 7
+        assert [command[0] for command in od.commands] == [
+            oscmd_helpers.OsCmdCommand.PHASE_INDUCTANCE_MEASUREMENT.value,
+            oscmd_helpers.OsCmdCommand.POLE_PAIR_DETECTION.value]
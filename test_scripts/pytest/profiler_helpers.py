@@ -11,11 +11,90 @@ It is recommended to use a standard way of importing:
 """
 
 import time
-import math
 import pytest
-import somanet_toolbox as stb
+import toolbox as stb
+from collections import deque
 from enum import Enum, unique
 
+# Interval used to poll the profilers, in seconds
+POLL_INTERVAL_S = 0.010
+
+
+def get_scaling_factors(od):
+    """Get the SI unit scaling factor, tachometer ratio, gear ratio and gearbox ratio of a device.
+    The toolbox caches them until the drive configuration is reloaded. The test fails if one of them is zero or
+    unknown.
+
+    Parameters
+    ----------
+    od:ObjectDictionary
+        Object dictionary of the device.
+    Returns
+    -------
+    factors:tuple
+        SI unit scaling factor, tachometer ratio, gear ratio and gearbox ratio.
+    """
+    factors = (stb.get_si_unit_scaling_factor(od), stb.get_tachometer_ratio(od), stb.get_gear_ratio(od),
+               stb.get_gearbox_ratio(od))
+    # The frame conversion factors are ratios of these, a zero or unknown one can't be converted
+    if not all(factors):
+        pytest.fail("Invalid scaling factors (SI unit: {}, tachometer ratio: {}, gear ratio: {}, "
+                    "gearbox ratio: {}), check the SI unit velocity and the gear ratio.".format(*factors))
+    return factors
+
+
+def _wait_until_reached(is_target_reached, restart_stabilization, od, demand_entry, poll_schedule, timeout,
+                        stabilization_duration):
+    """Poll a profiler until its target is reached or the timeout expires.
+    The demand value isn't read during the initial delay, so the stabilization restarts at the first poll after it.
+
+    Between checks, the loop waits for the demand value to change with the `wait_for(index, subindex, timeout)`
+    method of the object dictionary, or sleeps `POLL_INTERVAL_S` if it has none.
+
+    Parameters
+    ----------
+    is_target_reached:callable
+        Called with the current `time.monotonic()` value, returns True once the target is reached.
+    restart_stabilization:callable
+        Called after the initial delay, the stabilization duration then starts when the demand value is first seen
+        within tolerance.
+    od:ObjectDictionary
+        Object dictionary of the device.
+    demand_entry:
+        Getter of the demand value entry, e.g. `od.velocity_demand_value`.
+    poll_schedule:PollSchedule
+        Schedule giving the first poll delay, updated with the ramp duration once the target is reached.
+    timeout:float
+        Maximum time to wait, in seconds.
+    stabilization_duration:float
+        Time the demand value has to stay within tolerance, in seconds.
+    Returns
+    -------
+    reached:bool
+        True if the target was reached before the timeout.
+    """
+    monotonic = time.monotonic
+    if hasattr(od, 'wait_for'):
+        index, subindex = demand_entry.index, demand_entry.subindex
+
+        def wait():
+            od.wait_for(index, subindex, POLL_INTERVAL_S)
+    else:
+        def wait():
+            time.sleep(POLL_INTERVAL_S)
+
+    start = monotonic()
+    deadline = start + timeout
+    time.sleep(min(poll_schedule.initial_delay(), timeout))
+    restart_stabilization()
+    while True:
+        now = monotonic()
+        if is_target_reached(now):
+            poll_schedule.record(now - start - stabilization_duration)
+            return True
+        if now > deadline:
+            return False
+        wait()
 
 
 @unique
@@ -28,8 +107,45 @@ class VelocityParametersFrame(Enum):
     VELOCITY_CONTROL_FRAME = 2
     POSITION_CONTROL_FRAME = 3
 
+
+class PollSchedule:
+    """Delay before polling a profiler for the first time, learnt from the previous trajectories.
+
+    The demand value can't be within the target tolerance while the profiler ramps towards the target, so polling
+    only starts after half of the shortest ramp recorded so far.
+    """
+
+    def __init__(self, size=16):
+        self.ramp_durations = deque(maxlen=size)
+
+    def record(self, ramp_duration):
+        """Record the time a profiler took to reach its target, stabilization excluded.
+
+        Parameters
+        ----------
+        ramp_duration:float
+            Ramp duration in seconds.
+        """
+        self.ramp_durations.append(max(ramp_duration, 0))
+
+    def initial_delay(self):
+        """Get the time to wait before polling the profiler for the first time.
+
+        Returns
+        -------
+        delay:float
+            Delay in seconds, at least `POLL_INTERVAL_S`.
+        """
+        if not self.ramp_durations:
+            return POLL_INTERVAL_S
+        return max(min(self.ramp_durations) / 2, POLL_INTERVAL_S)
+
+
 class TorqueProfileHandler:
 
+    __slots__ = ('sc', 'od', 'torque_slope', 'target_torque', 'target_tolerance', 'profiler_timeout',
+                 'stabilization_duration', '_stabilization_deadline', '_in_tolerance')
+
     def __init__(self, sc, od):
         self.sc = sc
         self.od = od
@@ -39,6 +155,8 @@ class TorqueProfileHandler:
         self.target_tolerance = 0
         self.profiler_timeout = None
         self.stabilization_duration = None
+        self._stabilization_deadline = None
+        self._in_tolerance = False
 
     def set_profiler_configuration(self, 
                                    torque_slope, 
@@ -58,7 +176,7 @@ class TorqueProfileHandler:
         self.torque_slope = torque_slope
         self.od.torque_slope(self.torque_slope)
 
-        self.target_tolerance = target_tolerance
+        self.target_tolerance = int(target_tolerance)
 
         if profiler_timeout is not None:
             self.profiler_timeout = profiler_timeout
@@ -86,21 +204,40 @@ class TorqueProfileHandler:
         """
         self.target_torque = target_torque
         self.od.target_torque(self.target_torque)
+        self._in_tolerance = False
+
+    def is_target_reached(self, now=None):
+        """Check if the target torque is achieved.
 
-    def is_target_reached(self):
-        """Check if the target torque is achieved."""
+        Parameters
+        ----------
+        now:float (Optional)
+            Current `time.monotonic()` value, read here if not provided.
+        Returns
+        -------
+        reached:bool
+            True if the torque demand stayed within tolerance for the stabilization duration.
+        """
+        if now is None:
+            now = time.monotonic()
         # Check if the profiler is done
         torque_demand = self.od.torque_demand()
-        if math.isclose(torque_demand, self.target_torque,
-                        abs_tol=int(self.target_tolerance)):
-            if time.time() > self.stabilization_time:
-                return True
-        else:
-            self.stabilization_time = time.time() + self.stabilization_duration
-        return False
+        if abs(torque_demand - self.target_torque) > self.target_tolerance:
+            self._in_tolerance = False
+            return False
+        # Start the stabilization when the demand value enters the tolerance window
+        if not self._in_tolerance:
+            self._in_tolerance = True
+            self._stabilization_deadline = now + self.stabilization_duration
+        return now > self._stabilization_deadline
 
 class VelocityProfileHandler:
 
+    __slots__ = ('sc', 'od', 'si_unit_scaling_factor', 'tachometer_ratio_factor', 'gear_ratio_factor', 'gearbox_ratio',
+                 'acceleration', 'deceleration', 'target_tolerance', 'profiler_timeout', 'stabilization_duration',
+                 '_stabilization_deadline', '_in_tolerance', 'target_velocity', '_target_si', '_tolerance_si',
+                 'configured_frame', 'configured_frame_to_velocity_control_frame', '_frame_factors', 'poll_schedule')
+
     VELOCITY_PARAMETERS_FRAME = VelocityParametersFrame
     DEFAULT_PROFILER_TIMEOUT = 20
     DEFAULT_STABILIZATION_DURATION = 2
@@ -109,10 +246,8 @@ class VelocityProfileHandler:
         self.sc = sc
         self.od = od
 
-        self.si_unit_scaling_factor = stb.get_si_unit_scaling_factor(od)
-        self.tachometer_ratio_factor = stb.get_tachometer_ratio(od)
-        self.gear_ratio_factor = stb.get_gear_ratio(od)
-        self.gearbox_ratio = stb.get_gearbox_ratio(od)
+        (self.si_unit_scaling_factor, self.tachometer_ratio_factor, self.gear_ratio_factor,
+         self.gearbox_ratio) = get_scaling_factors(od)
 
         # Profile acceleration/deceleration in RPM/s and in the velocity control frame
         self.acceleration = 0
@@ -123,14 +258,28 @@ class VelocityProfileHandler:
 
         self.profiler_timeout = self.DEFAULT_PROFILER_TIMEOUT
         self.stabilization_duration = self.DEFAULT_STABILIZATION_DURATION
-        self.stabilization_time = None
+        self._stabilization_deadline = None
+        self._in_tolerance = False
+        # First poll delay, learnt from the trajectories of this handler
+        self.poll_schedule = PollSchedule()
 
         # Target velocity in RPM and in the velocity control frame
         self.target_velocity = 0
+        # Target velocity and tolerance in the drive's SI unit, as compared with the demand value
+        self._target_si = 0
+        self._tolerance_si = 0
 
         # Variable to select the configuration frame
         self.configured_frame = None
         self.configured_frame_to_velocity_control_frame = 0
+        # Factors to convert every configured frame to velocity control frame
+        frames = self.VELOCITY_PARAMETERS_FRAME
+        self._frame_factors = {
+            frames.DRIVE_SHAFT_FRAME: self.gearbox_ratio / self.tachometer_ratio_factor,
+            frames.MOTOR_SHAFT_FRAME: 1 / self.tachometer_ratio_factor,
+            frames.VELOCITY_CONTROL_FRAME: 1,
+            frames.POSITION_CONTROL_FRAME: self.gear_ratio_factor / self.tachometer_ratio_factor,
+        }
 
     def set_profiler_configuration(self, velocity_parameters_frame, acceleration, deceleration, target_tolerance,
                                    profiler_timeout=None, stabilization_duration=None):
@@ -161,27 +310,14 @@ class VelocityProfileHandler:
         """
         self.configured_frame = velocity_parameters_frame
 
-        if self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.DRIVE_SHAFT_FRAME:
-            # Factor to convert configured frame (drive shaft frame) to velocity control frame
-            self.configured_frame_to_velocity_control_frame = self.gearbox_ratio / self.tachometer_ratio_factor
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.MOTOR_SHAFT_FRAME:
-            # Factor to convert configured frame (motor shaft frame) to velocity control frame
-            self.configured_frame_to_velocity_control_frame = 1 / self.tachometer_ratio_factor
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.VELOCITY_CONTROL_FRAME:
-            # Factor to convert configured frame (velocity control frame) to velocity control frame
-            self.configured_frame_to_velocity_control_frame = 1
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.POSITION_CONTROL_FRAME:
-            # Factor to convert configured frame (position control frame) to velocity control frame
-            self.configured_frame_to_velocity_control_frame = self.gear_ratio_factor / self.tachometer_ratio_factor
+        self.configured_frame_to_velocity_control_frame = self._frame_factors[self.configured_frame]
 
         # Convert the variables from configured frame to velocity control frame
         self.target_tolerance = target_tolerance * self.configured_frame_to_velocity_control_frame
+        self._tolerance_si = int(self.target_tolerance * self.si_unit_scaling_factor)
         self.acceleration = acceleration * self.configured_frame_to_velocity_control_frame
         self.deceleration = deceleration * self.configured_frame_to_velocity_control_frame
 
-        # Set the parameters once changed to the configured frame
-        self.od.profile_acceleration(int(self.acceleration * self.si_unit_scaling_factor))
-        self.od.profile_deceleration(int(self.deceleration * self.si_unit_scaling_factor))
         if profiler_timeout is not None:
             self.profiler_timeout = profiler_timeout
         if stabilization_duration is not None:
@@ -189,7 +325,12 @@ class VelocityProfileHandler:
 
         # Reset velocity to 0
         self.target_velocity = 0
-        self.od.target_velocity(self.target_velocity)
+        self._target_si = 0
+
+        # Set the parameters once changed to the configured frame, and the target velocity, in one request
+        self.od.set_values([(self.od.profile_acceleration, int(self.acceleration * self.si_unit_scaling_factor)),
+                            (self.od.profile_deceleration, int(self.deceleration * self.si_unit_scaling_factor)),
+                            (self.od.target_velocity, self.target_velocity)])
 
     def set_op_mode(self):
         """Sets the Profile velocity op mode."""
@@ -212,22 +353,41 @@ class VelocityProfileHandler:
         """
         # Convert target velocity to velocity control frame
         self.target_velocity = int(target_velocity * self.configured_frame_to_velocity_control_frame)
-        self.od.target_velocity(self.target_velocity * self.si_unit_scaling_factor)
+        self._target_si = self.target_velocity * self.si_unit_scaling_factor
+        self.od.target_velocity(self._target_si)
 
         # Initialize stabilization time
-        self.stabilization_time = time.time() + self.stabilization_duration
+        self._stabilization_deadline = time.monotonic() + self.stabilization_duration
+        self._in_tolerance = True
+
+    def _restart_stabilization(self):
+        """Start the stabilization again at the next poll where the demand value is within tolerance."""
+        self._in_tolerance = False
 
-    def is_target_reached(self):
-        """Check if the target velocity is achieved."""
+    def is_target_reached(self, now=None):
+        """Check if the target velocity is achieved.
+
+        Parameters
+        ----------
+        now:float (Optional)
+            Current `time.monotonic()` value, read here if not provided.
+        Returns
+        -------
+        reached:bool
+            True if the velocity demand stayed within tolerance for the stabilization duration.
+        """
+        if now is None:
+            now = time.monotonic()
         # Check if the profiler is done
         velocity_demand_value = self.od.velocity_demand_value()
-        if math.isclose(velocity_demand_value, self.target_velocity * self.si_unit_scaling_factor,
-                        abs_tol=int(self.target_tolerance * self.si_unit_scaling_factor)):
-            if time.time() > self.stabilization_time:
-                return True
-        else:
-            self.stabilization_time = time.time() + self.stabilization_duration
-        return False
+        if abs(velocity_demand_value - self._target_si) > self._tolerance_si:
+            self._in_tolerance = False
+            return False
+        # Start the stabilization when the demand value enters the tolerance window
+        if not self._in_tolerance:
+            self._in_tolerance = True
+            self._stabilization_deadline = now + self.stabilization_duration
+        return now > self._stabilization_deadline
 
     def go_to_velocity(self, target_velocity):
         """Go to target velocity and wait until it is achieved.
@@ -242,22 +402,25 @@ class VelocityProfileHandler:
         """
         self.set_target_velocity(target_velocity)
         # Check if the profiler is done
-        timeout = time.time() + self.profiler_timeout
-        while True:
-            time.sleep(0.010)
-            if self.is_target_reached():
-                return
-            if time.time() > timeout:
-                velocity_demand_value = self.od.velocity_demand_value()
-                pytest.fail("Target velocity ({} RPM) wasn't achieved ({} RPM).".format(
-                    self.target_velocity / self.configured_frame_to_velocity_control_frame,
-                    (velocity_demand_value / self.si_unit_scaling_factor) /
-                    self.configured_frame_to_velocity_control_frame))
+        if not _wait_until_reached(self.is_target_reached, self._restart_stabilization, self.od,
+                                   self.od.velocity_demand_value, self.poll_schedule, self.profiler_timeout,
+                                   self.stabilization_duration):
+            velocity_demand_value = self.od.velocity_demand_value()
+            pytest.fail("Target velocity ({} RPM) wasn't achieved ({} RPM).".format(
+                self.target_velocity / self.configured_frame_to_velocity_control_frame,
+                (velocity_demand_value / self.si_unit_scaling_factor) /
+                self.configured_frame_to_velocity_control_frame))
 
 
 class ProfilePositionHandler:
     """Handler to use the position profiler."""
 
+    __slots__ = ('sc', 'od', 'si_unit_scaling_factor', 'tachometer_ratio_factor', 'gear_ratio_factor', 'gearbox_ratio',
+                 'acceleration', 'deceleration', 'max_velocity', 'target_tolerance', 'profiler_timeout',
+                 'stabilization_duration', '_stabilization_deadline', '_in_tolerance', 'target_position',
+                 'configured_frame', 'configured_frame_to_position_control_frame', '_frame_factors',
+                 'poll_schedule')
+
     VELOCITY_PARAMETERS_FRAME = VelocityParametersFrame
     DEFAULT_TARGET_TOLERANCE = 30
     DEFAULT_PROFILER_TIMEOUT = 20
@@ -267,10 +430,8 @@ class ProfilePositionHandler:
         self.sc = sc
         self.od = od
 
-        self.si_unit_scaling_factor = stb.get_si_unit_scaling_factor(od)
-        self.tachometer_ratio_factor = stb.get_tachometer_ratio(od)
-        self.gear_ratio_factor = stb.get_gear_ratio(od)
-        self.gearbox_ratio = stb.get_gearbox_ratio(od)
+        (self.si_unit_scaling_factor, self.tachometer_ratio_factor, self.gear_ratio_factor,
+         self.gearbox_ratio) = get_scaling_factors(od)
 
         # Profile acceleration/deceleration in RPM/s and in the position control frame
         self.acceleration = 0
@@ -282,13 +443,24 @@ class ProfilePositionHandler:
         self.target_tolerance = self.DEFAULT_TARGET_TOLERANCE
         self.profiler_timeout = self.DEFAULT_PROFILER_TIMEOUT
         self.stabilization_duration = self.DEFAULT_STABILIZATION_DURATION
-        self.stabilization_time = None
+        self._stabilization_deadline = None
+        self._in_tolerance = False
+        # First poll delay, learnt from the trajectories of this handler
+        self.poll_schedule = PollSchedule()
 
         self.target_position = None
 
         # Variable to select the configuration frame
         self.configured_frame = None
         self.configured_frame_to_position_control_frame = 0
+        # Factors to convert every configured frame to position control frame
+        frames = self.VELOCITY_PARAMETERS_FRAME
+        self._frame_factors = {
+            frames.DRIVE_SHAFT_FRAME: self.gearbox_ratio / self.gear_ratio_factor,
+            frames.MOTOR_SHAFT_FRAME: 1 / self.gear_ratio_factor,
+            frames.POSITION_CONTROL_FRAME: 1,
+            frames.VELOCITY_CONTROL_FRAME: self.tachometer_ratio_factor / self.gear_ratio_factor,
+        }
 
     def set_profiler_configuration(self, velocity_parameters_frame, acceleration, deceleration, max_velocity,
                                    target_tolerance=None, profiler_timeout=None, stabilization_duration=None):
@@ -321,28 +493,17 @@ class ProfilePositionHandler:
         """
         self.configured_frame = velocity_parameters_frame
 
-        if self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.DRIVE_SHAFT_FRAME:
-            # Factor to convert configured frame (drive shaft frame) to position control frame
-            self.configured_frame_to_position_control_frame = self.gearbox_ratio / self.gear_ratio_factor
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.MOTOR_SHAFT_FRAME:
-            # Factor to convert configured frame (motor shaft frame) to position control frame
-            self.configured_frame_to_position_control_frame = 1 / self.gear_ratio_factor
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.POSITION_CONTROL_FRAME:
-            # Factor to convert configured frame (position control frame) to position control frame
-            self.configured_frame_to_position_control_frame = 1
-        elif self.configured_frame is self.VELOCITY_PARAMETERS_FRAME.VELOCITY_CONTROL_FRAME:
-            # Factor to convert configured frame (velocity control frame) to position control frame
-            self.configured_frame_to_position_control_frame = self.tachometer_ratio_factor / self.gear_ratio_factor
+        self.configured_frame_to_position_control_frame = self._frame_factors[self.configured_frame]
 
         # Convert the variables from configured frame to position control frame
         self.acceleration = acceleration * self.configured_frame_to_position_control_frame
         self.deceleration = deceleration * self.configured_frame_to_position_control_frame
         self.max_velocity = max_velocity * self.configured_frame_to_position_control_frame
 
-        # Set the parameters once changed to the configured frame
-        self.od.profile_acceleration(int(self.acceleration * self.si_unit_scaling_factor))
-        self.od.profile_deceleration(int(self.deceleration * self.si_unit_scaling_factor))
-        self.od.profile_velocity(int(self.max_velocity * self.si_unit_scaling_factor))
+        # Set the parameters once changed to the configured frame, in one request
+        self.od.set_values([(self.od.profile_acceleration, int(self.acceleration * self.si_unit_scaling_factor)),
+                            (self.od.profile_deceleration, int(self.deceleration * self.si_unit_scaling_factor)),
+                            (self.od.profile_velocity, int(self.max_velocity * self.si_unit_scaling_factor))])
         if target_tolerance is not None:
             self.target_tolerance = target_tolerance
         if profiler_timeout is not None:
@@ -383,9 +544,14 @@ class ProfilePositionHandler:
         self.sc.pp_reset_bits()
 
         # Initialize stabilization time
-        self.stabilization_time = time.time() + self.stabilization_duration
+        self._stabilization_deadline = time.monotonic() + self.stabilization_duration
+        self._in_tolerance = True
 
-    def is_target_reached(self, expected_position=None):
+    def _restart_stabilization(self):
+        """Start the stabilization again at the next poll where the demand value is within tolerance."""
+        self._in_tolerance = False
+
+    def is_target_reached(self, expected_position=None, now=None):
         """Check if the target position is achieved,
 
         Parameters
@@ -393,6 +559,8 @@ class ProfilePositionHandler:
         expected_position:int (Optional)
             Expected position in encoder ticks.
             If this value is not provided, target position will be taken as expected position.
+        now:float (Optional)
+            Current `time.monotonic()` value, read here if not provided.
         Returns
         -------
             Nothing
@@ -406,14 +574,18 @@ class ProfilePositionHandler:
         else:
             expected_position_internal = expected_position
 
+        if now is None:
+            now = time.monotonic()
         # Check if the profiler is done
         demand_position_internal = self.od.position_demand_internal_value()
-        if math.isclose(demand_position_internal, expected_position_internal, abs_tol=self.target_tolerance):
-            if time.time() > self.stabilization_time:
-                return True
-        else:
-            self.stabilization_time = time.time() + self.stabilization_duration
-        return False
+        if abs(demand_position_internal - expected_position_internal) > self.target_tolerance:
+            self._in_tolerance = False
+            return False
+        # Start the stabilization when the demand value enters the tolerance window
+        if not self._in_tolerance:
+            self._in_tolerance = True
+            self._stabilization_deadline = now + self.stabilization_duration
+        return now > self._stabilization_deadline
 
     def go_to_position(self, target_position, expected_position=None):
         """Go to target position and wait until it is achieved.
@@ -431,12 +603,10 @@ class ProfilePositionHandler:
         """
         self.start_trajectory(target_position)
         # Check if the profiler is done
-        timeout = time.time() + self.profiler_timeout
-        while True:
-            time.sleep(0.010)
-            if self.is_target_reached(expected_position):
-                return
-            if time.time() > timeout:
-                demand_position_internal = self.od.position_demand_internal_value()
-                pytest.fail("Expected position ({}) wasn't achieved ({}) when setting target position ({}).".format(
-                    expected_position, demand_position_internal, self.target_position))
+        if not _wait_until_reached(lambda now: self.is_target_reached(expected_position, now),
+                                   self._restart_stabilization, self.od,
+                                   self.od.position_demand_internal_value, self.poll_schedule, self.profiler_timeout,
+                                   self.stabilization_duration):
+            demand_position_internal = self.od.position_demand_internal_value()
+            pytest.fail("Expected position ({}) wasn't achieved ({}) when setting target position ({}).".format(
+                expected_position, demand_position_internal, self.target_position))
@@ -24,8 +24,29 @@ import pytest
 import time
 import math
 import logging
+import weakref
 from enum import Enum, unique
-from typing import List
+from typing import List, Tuple
+
+# Configured sensors of every object dictionary, see `get_sensor_configs()`
+_sensor_configs = weakref.WeakKeyDictionary()
+# SI unit velocity of every object dictionary, see `get_si_unit_velocity()`
+_si_unit_velocities = weakref.WeakKeyDictionary()
+# Gearbox ratio of every object dictionary, see `get_gearbox_ratio()`
+_gearbox_ratios = weakref.WeakKeyDictionary()
+# Device name of every object dictionary, it doesn't change with the configuration
+_device_names = weakref.WeakKeyDictionary()
+
+# Time where the SoC timer overflows, see `remove_soc_timer_wraparound()`
+_SOC_TIMER_MAX_TIME = int(2 ** 32 / 100) / 1e3
+
+# Circulo devices with internal encoders
+_CIRCULO_WITH_INTERNAL_ENCODERS = frozenset(['8502-01', '8502-02', '8503-01', '8503-02', '8504-01', '8504-02',
+                                             '8505-01', '8505-02'])
+
+# Velocity scaling factor and RPM unit of every SI unit velocity
+_SI_UNIT_SCALING_FACTORS = {11814656: 1, 4290004736: 10, 4273227520: 100, 4256450304: 1000}
+_RPM_UNITS = {11814656: 'rpm', 4290004736: 'deci-rpm', 4273227520: 'centi-rpm', 4256450304: 'mili-rpm'}
 
 
 def reload_drive_configuration(sc):
@@ -33,7 +54,9 @@ def reload_drive_configuration(sc):
 
     This will trigger the drive to read the Object dictionary to see if some value changed.
     Some objects don't need this because they are updated continuously.
+    The cached drive configuration is cleared, as it may have changed.
     """
+    clear_drive_configuration_caches()
 
     if sc.has_fault():
         # If the state is `Fault`, reset fault will reload the configuration.
@@ -56,6 +79,19 @@ class SensorFunctions(Enum):
     COMMUTATION_AND_VELOCITY = 7
 
 
+# Values of the sensor functions used for commutation, position control and velocity control
+_COMMUTATION_FUNCTIONS = frozenset([SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
+                                    SensorFunctions.COMMUTATION_AND_MONITORING.value,
+                                    SensorFunctions.COMMUTATION_ONLY.value,
+                                    SensorFunctions.COMMUTATION_AND_VELOCITY.value])
+_POSITION_CONTROL_FUNCTIONS = frozenset([SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
+                                         SensorFunctions.MOTION_CONTROL_FEEDBACK_ONLY.value,
+                                         SensorFunctions.POSITION.value])
+_VELOCITY_CONTROL_FUNCTIONS = frozenset([SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
+                                         SensorFunctions.MOTION_CONTROL_FEEDBACK_ONLY.value,
+                                         SensorFunctions.COMMUTATION_AND_VELOCITY.value])
+
+
 @unique
 class SensorPorts(Enum):
     SENSOR_PORT_1 = 0
@@ -69,6 +105,39 @@ class ExceptionSensorConfig(Exception):
     pass
 
 
+def get_sensor_configs(od) -> Tuple:
+    """Get the sensors configured on the feedback sensor ports.
+    They are read from the object dictionary once and cached until `reload_drive_configuration()` or
+    `clear_drive_configuration_caches()` is called.
+
+    Parameters
+    ----------
+    od
+
+    Returns
+    -------
+    sensor_configs : Tuple
+        (subindex, sensor config index, sensor function) of every port with a sensor configured, in port order.
+    """
+    sensor_configs = _sensor_configs.get(od)
+    if sensor_configs is None:
+        sensor_configs = []
+        for subindex in range(1, od.feedback_sensor_ports_subindex() + 1):
+            sensor_config_index = od.feedback_sensor_ports(subindex)
+            if sensor_config_index != 0:
+                # This implies there is a sensor configured. Get the configuration.
+                sensor_configs.append((subindex, sensor_config_index, od.parameter(sensor_config_index, 2)))
+        sensor_configs = _sensor_configs[od] = tuple(sensor_configs)
+    return sensor_configs
+
+
+def clear_drive_configuration_caches():
+    """Forget the cached configuration (sensors, SI unit velocity, gearbox ratio) of all the devices."""
+    _sensor_configs.clear()
+    _si_unit_velocities.clear()
+    _gearbox_ratios.clear()
+
+
 def get_motion_encoder_config_index(od, position_control=None, velocity_control=None) -> int:
     """Return the index of the encoder config used for:
     * Motion control (position_control=True, velocity_control=True)
@@ -93,13 +162,10 @@ def get_motion_encoder_config_index(od, position_control=None, velocity_control=
         if position_control is None:
             selected_functions.append(SensorFunctions.COMMUTATION_AND_VELOCITY)
 
-    for subindex in range(0, od.feedback_sensor_ports_subindex()):
-        sensor_config_index = od.feedback_sensor_ports(subindex + 1)
-        if sensor_config_index != 0:
-            # This implies there is a sensor configured. Get the configuration.
-            sensor_function = od.parameter(sensor_config_index, 2)
-            if sensor_function in [x.value for x in selected_functions]:
-                return sensor_config_index
+    selected_function_values = frozenset(x.value for x in selected_functions)
+    for _, sensor_config_index, sensor_function in get_sensor_configs(od):
+        if sensor_function in selected_function_values:
+            return sensor_config_index
 
     raise ExceptionSensorConfig("No sensor is configured for any of the following functions: {}.".format(
         ', '.join([x.name for x in selected_functions])))
@@ -108,16 +174,9 @@ def get_motion_encoder_config_index(od, position_control=None, velocity_control=
 def get_commutation_encoder_config_index(od) -> int:
     """Return the index of the encoder config used for commutation."""
 
-    for subindex in range(0, od.feedback_sensor_ports_subindex()):
-        sensor_config_index = od.feedback_sensor_ports(subindex + 1)
-        if sensor_config_index != 0:
-            # This implies there is a sensor configured. Get the configuration.
-            sensor_function = od.parameter(sensor_config_index, 2)
-            if sensor_function in [SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
-                                   SensorFunctions.COMMUTATION_AND_MONITORING.value,
-                                   SensorFunctions.COMMUTATION_ONLY.value,
-                                   SensorFunctions.COMMUTATION_AND_VELOCITY.value]:
-                return sensor_config_index
+    for _, sensor_config_index, sensor_function in get_sensor_configs(od):
+        if sensor_function in _COMMUTATION_FUNCTIONS:
+            return sensor_config_index
     raise ExceptionSensorConfig("No sensor is configured for commutation.")
 
 
@@ -134,15 +193,10 @@ def get_sensor_function_for_position_control(od) -> int:
         sensor function
 
     """
-    for subindex in range(0, od.feedback_sensor_ports_subindex()):
-        sensor_config_index = od.feedback_sensor_ports(subindex + 1)
-        if sensor_config_index != 0:
-            sensor_function = od.parameter(sensor_config_index, 2)
-            if sensor_function in [SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
-                                   SensorFunctions.MOTION_CONTROL_FEEDBACK_ONLY.value,
-                                   SensorFunctions.POSITION.value]:
-                # It's used for position control!
-                return sensor_function
+    for _, _, sensor_function in get_sensor_configs(od):
+        if sensor_function in _POSITION_CONTROL_FUNCTIONS:
+            # It's used for position control!
+            return sensor_function
 
     raise ExceptionSensorConfig("No sensor is configured for position control.")
 
@@ -157,15 +211,10 @@ def get_sensor_function_for_velocity_control(od) -> int:
         int
         sensor function
     """
-    for subindex in range(0, od.feedback_sensor_ports_subindex()):
-        sensor_config_index = od.feedback_sensor_ports(subindex + 1)
-        if sensor_config_index != 0:
-            sensor_function = od.parameter(sensor_config_index, 2)
-            if sensor_function in [SensorFunctions.COMMUTATION_AND_MOTION_CONTROL_FEEDBACK.value,
-                                   SensorFunctions.MOTION_CONTROL_FEEDBACK_ONLY.value,
-                                   SensorFunctions.COMMUTATION_AND_VELOCITY.value]:
-                # It's used for velocity control!
-                return sensor_function
+    for _, _, sensor_function in get_sensor_configs(od):
+        if sensor_function in _VELOCITY_CONTROL_FUNCTIONS:
+            # It's used for velocity control!
+            return sensor_function
 
     raise ExceptionSensorConfig("No sensor is configured for velocity control.")
 
@@ -174,9 +223,10 @@ def has_circulo_internal_sensors(od) -> bool:
     """
     Check whether the drive has circulo internal sensors.
     """
-    circulo_with_internal_encoders = ['8502-01', '8502-02', '8503-01', '8503-02', '8504-01', '8504-02',
-                                      '8505-01', '8505-02']
-    return od.manufacturer_device_name() in circulo_with_internal_encoders
+    device_name = _device_names.get(od)
+    if device_name is None:
+        device_name = _device_names[od] = od.manufacturer_device_name()
+    return device_name in _CIRCULO_WITH_INTERNAL_ENCODERS
 
 
 def get_enabled_circulo_internal_sensor_ports(od) -> List:
@@ -194,16 +244,34 @@ def get_enabled_circulo_internal_sensor_ports(od) -> List:
     """
     sensor_ports = []
     if has_circulo_internal_sensors(od):
+        sensor_functions = {subindex: sensor_function for subindex, _, sensor_function in get_sensor_configs(od)}
         for sensor_port in [SensorPorts.SENSOR_PORT_1, SensorPorts.SENSOR_PORT_2]:
-            sensor_config_index = od.feedback_sensor_ports(sensor_port.value + 1)
-            if sensor_config_index != 0:
-                # This implies there is a sensor configured. Get the configuration.
-                sensor_function = od.parameter(sensor_config_index, 2)
-                if sensor_function is not SensorFunctions.DISABLED.value:
-                    sensor_ports.append(sensor_port)
+            sensor_function = sensor_functions.get(sensor_port.value + 1, SensorFunctions.DISABLED.value)
+            if sensor_function != SensorFunctions.DISABLED.value:
+                sensor_ports.append(sensor_port)
     return sensor_ports
 
 
+def get_si_unit_velocity(od) -> int:
+    """Get the SI unit velocity of a device.
+    It is read from the object dictionary once and cached until `reload_drive_configuration()` or
+    `clear_drive_configuration_caches()` is called.
+
+    Parameters
+    ----------
+    od
+
+    Returns
+    -------
+        int
+        SI unit velocity
+    """
+    si_unit_velocity = _si_unit_velocities.get(od)
+    if si_unit_velocity is None:
+        si_unit_velocity = _si_unit_velocities[od] = od.si_unit_velocity()
+    return si_unit_velocity
+
+
 def get_si_unit_scaling_factor(od) -> int:
     """Calculates SI_unit_velocity factor based on the SI unit velocity prefix
 
@@ -218,16 +286,7 @@ def get_si_unit_scaling_factor(od) -> int:
 
     """
 
-    si_unit_velocity = od.si_unit_velocity()
-
-    if si_unit_velocity == 11814656:
-        return 1
-    if si_unit_velocity == 4290004736:
-        return 10
-    if si_unit_velocity == 4273227520:
-        return 100
-    if si_unit_velocity == 4256450304:
-        return 1000
+    return _SI_UNIT_SCALING_FACTORS.get(get_si_unit_velocity(od))
 
 
 def get_rpm_unit(od) -> str:
@@ -241,21 +300,14 @@ def get_rpm_unit(od) -> str:
         RPM unit with SI prefix
     """
 
-    si_unit_velocity = od.si_unit_velocity()
-
-    if si_unit_velocity == 11814656:
-        return 'rpm'
-    if si_unit_velocity == 4290004736:
-        return 'deci-rpm'
-    if si_unit_velocity == 4273227520:
-        return 'centi-rpm'
-    if si_unit_velocity == 4256450304:
-        return 'mili-rpm'
+    return _RPM_UNITS.get(get_si_unit_velocity(od))
 
 
 def get_gearbox_ratio(od):
     """ Calculate the gear ratio factor
     This is the factor between the motor shaft and the drive shaft.
+    It is read from the object dictionary once and cached until `reload_drive_configuration()` or
+    `clear_drive_configuration_caches()` is called.
 
     Returns
     -------
@@ -263,8 +315,11 @@ def get_gearbox_ratio(od):
         Gear ratio factor
     """
 
-    gear_ratio = od.gear_ratio_motor_revolutions()  # Gear ratio: motor rev
-    gear_ratio //= od.gear_ratio_shaft_revolutions()  # Gear ratio: shaft rev
+    gear_ratio = _gearbox_ratios.get(od)
+    if gear_ratio is None:
+        gear_ratio = od.gear_ratio_motor_revolutions()  # Gear ratio: motor rev
+        gear_ratio //= od.gear_ratio_shaft_revolutions()  # Gear ratio: shaft rev
+        _gearbox_ratios[od] = gear_ratio
     return gear_ratio
 
 
@@ -310,21 +365,53 @@ def get_tachometer_ratio(od):
     return tachometer_ratio
 
 
+def wait_until(predicate, timeout, initial_interval=0.005, growth=1.5, max_interval=0.1) -> bool:
+    """Wait until a condition is met, checking it right away and then with a growing interval.
+
+    Parameters
+    ----------
+    predicate : callable
+        Function without arguments that returns True once the condition is met.
+    timeout : float
+        Maximum time to wait, in seconds.
+    initial_interval : float, optional
+        Time between the first two checks, in seconds.
+    growth : float, optional
+        Factor the interval grows by after every check.
+    max_interval : float, optional
+        Maximum time between two checks, in seconds.
+
+    Returns
+    -------
+        bool
+        True if the condition was met before the timeout.
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    while not predicate():
+        remaining = deadline - time.monotonic()
+        if remaining < 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * growth, max_interval)
+    return True
+
+
 def set_current_position(od, sc, desired_position):
     """Set the current position to desired_position (with home offset)"""
 
     # Make sure motor is not turning
-    timeout = time.time() + 5
+    timeout = time.monotonic() + 5
     current_position = od.position_actual_value()
     while True:
         time.sleep(0.5000)
-        if math.isclose(current_position, od.position_actual_value(), abs_tol=20):
+        new_position = od.position_actual_value()
+        if math.isclose(current_position, new_position, abs_tol=20):
             break
-        else:
-            if time.time() > timeout:
-                pytest.fail("Motor is still turning ({} -> {} in the last 0.5 seconds).".format(
-                    current_position, od.position_actual_value()))
-            current_position = od.position_actual_value()
+        if time.monotonic() > timeout:
+            pytest.fail("Motor is still turning ({} -> {} in the last 0.5 seconds).".format(
+                current_position, new_position))
+        current_position = new_position
 
     # Set Home offset using current position and home offset
     home_offset = od.home_offset()
@@ -335,19 +422,12 @@ def set_current_position(od, sc, desired_position):
     od.home_offset(value=new_home_offset)
     reload_drive_configuration(sc)
 
-    # Check if the profiler is done
-    timeout = time.time() + 2
-    while True:
-        current_position = od.position_actual_value()
-        time.sleep(0.010)
-        if math.isclose(current_position, desired_position, abs_tol=20):
-            logging.debug("Home offset changed from {} to {}. The position actual value changed from {} to {}."
-                         .format(home_offset, new_home_offset, old_current_position, desired_position))
-            break
-
-        if time.time() > timeout:
-            pytest.fail("Position {} didn't change to {} when setting home offset. Current position is {}.".format(
-                old_current_position, desired_position, current_position))
+    # Check if the position actual value changed
+    if not wait_until(lambda: math.isclose(od.position_actual_value(), desired_position, abs_tol=20), 2):
+        pytest.fail("Position {} didn't change to {} when setting home offset. Current position is {}.".format(
+            old_current_position, desired_position, od.position_actual_value()))
+    logging.debug("Home offset changed from {} to {}. The position actual value changed from {} to {}."
+                  .format(home_offset, new_home_offset, old_current_position, desired_position))
 
 
 def remove_soc_timer_wraparound(time_array, diff_threshold=-30e3):
@@ -381,33 +461,36 @@ def remove_soc_timer_wraparound(time_array, diff_threshold=-30e3):
     """
     # TODO: Might be nice to have the ability to start the time from the original start, rather than from zero?
 
-    # Take the numerical derivative of the time.
-    time_diff = np.diff(time_array)
-    # Compute the time where an overflow will happen.
-    max_time = int(2 ** 32 / 100) / 1e3
-    # Find the spikes (where the diff is very big negative number).
-    wrap_indices = np.where(time_diff <= diff_threshold)
-    # Subtract out the expected max value for the time, for all discontinuities.
+    # Everything is computed in place in the output array: the numerical derivative of the time goes after the
+    # leading zero, which preserves the length.
+    time_array = np.asarray(time_array)
+    time_data_repaired = np.empty(max(time_array.size, 1), dtype=np.result_type(time_array, _SOC_TIMER_MAX_TIME))
+    time_data_repaired[0] = 0
+    time_diff = time_data_repaired[1:]
+    np.subtract(time_array[1:], time_array[:-1], out=time_diff)
+    # Find the spikes (where the diff is very big negative number) and subtract out the expected max value for the
+    # time, for all discontinuities.
     # This intends to preserve the time-delta for the sample where the discontinuity happened.
-    for index in wrap_indices:
-        time_diff[index] += max_time
+    np.add(time_diff, _SOC_TIMER_MAX_TIME, out=time_diff, where=time_diff <= diff_threshold)
     # Take the cumulative sum (integral) to get back to the original time series.
-    # Note that this starts from zero (removes the initial time offset). Add zero to the start to preserve length.
-    time_data_repaired = np.cumsum(np.insert(time_diff, 0, 0))
+    # Note that this starts from zero (removes the initial time offset).
+    np.cumsum(time_diff, out=time_diff)
     return time_data_repaired
 
 
-def get_data_overflows(data, data_resolution, max_step_relative=0.1):
+def get_data_overflows(data, data_resolution, max_step_relative=0.1, return_numpy=False):
     """Check where are the overflows in the data and return the positions in the list where it happened.
 
     Parameters
     ----------
     data : List
-        A list with the data to check.
+        A list (or Numpy array) with the data to check.
     data_resolution : int
         Resolution of the data to check.
     max_step_relative : float, optional
         Maximum step that the position data can have, relative to the data resolution
+    return_numpy : bool, optional
+        Return Numpy arrays instead of lists.
 
     Returns
     -------
@@ -416,40 +499,49 @@ def get_data_overflows(data, data_resolution, max_step_relative=0.1):
     negative_overflows : List
         A list with the position of the negative overflows.
     """
-    positive_overflows = []
-    negative_overflows = []
     low_overflow_threshold = data_resolution * max_step_relative
     high_overflow_threshold = data_resolution * (1 - max_step_relative)
-    for i in range(1, len(data)):
-        if data[i - 1] > high_overflow_threshold and data[i] < low_overflow_threshold:
-            positive_overflows.append(i)
-        if data[i - 1] < low_overflow_threshold and data[i] > high_overflow_threshold:
-            negative_overflows.append(i)
-    return positive_overflows, negative_overflows
-
-
-def remove_data_overflows(data, data_resolution, max_step_relative=0.1):
+    data = np.asarray(data)
+    # Compare every sample with the previous one, an overflow is reported at the index of the later sample.
+    previous_low = data[:-1] < low_overflow_threshold
+    previous_high = data[:-1] > high_overflow_threshold
+    current_low = data[1:] < low_overflow_threshold
+    current_high = data[1:] > high_overflow_threshold
+    positive_overflows = np.nonzero(previous_high & current_low)[0] + 1
+    negative_overflows = np.nonzero(previous_low & current_high)[0] + 1
+    if return_numpy:
+        return positive_overflows, negative_overflows
+    return positive_overflows.tolist(), negative_overflows.tolist()
+
+
+def remove_data_overflows(data, data_resolution, max_step_relative=0.1, return_numpy=False):
     """Remove all overflows from data to make it continuous.
 
     Parameters
     ----------
     data : List
-        A list with the data to modify.
+        A list (or Numpy array) with the data to modify.
     data_resolution : int
         Resolution of the data to modify.
     max_step_relative : float, optional
         Maximum step that the position data can have, relative to the data resolution
+    return_numpy : bool, optional
+        Return a Numpy array instead of a list.
 
     Returns
     -------
     continuous_data : List
         A list with the modified data.
     """
-    positive_overflows, negative_overflows = get_data_overflows(data, data_resolution, max_step_relative)
-    continuous_data = list(data)
-    for position in positive_overflows:
-        continuous_data[position:] = [x + data_resolution for x in continuous_data[position:]]
-    for position in negative_overflows:
-        continuous_data[position:] = [x - data_resolution for x in continuous_data[position:]]
-    return continuous_data
+    positive_overflows, negative_overflows = get_data_overflows(data, data_resolution, max_step_relative,
+                                                                return_numpy=True)
+    data = np.asarray(data)
+    # Step of every sample caused by the overflows, its cumulative sum is the offset to add to the data.
+    steps = np.zeros(data.size, dtype=np.result_type(data, data_resolution))
+    steps[positive_overflows] += data_resolution
+    steps[negative_overflows] -= data_resolution
+    continuous_data = data + np.cumsum(steps)
+    if return_numpy:
+        return continuous_data
+    return continuous_data.tolist()
 